@@ -0,0 +1,97 @@
+# bench/parser_parity.py
+"""
+Проверка, что все бэкенды HTML-парсера (bot/parser_backend.py) дают
+одинаковые посты и темы на сохранённых страницах форума.
+
+    python bench/parser_parity.py [папка или файлы .html ...]
+
+Тема или раздел определяется по содержимому страницы. Код выхода 1 —
+есть расхождения (печатается первое отличие по каждой странице).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.parser_backend import BACKENDS, available, get_backend  # noqa: E402
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+PAGE_URL = "https://forum.matrp.ru/index.php?threads/test.1/"
+FORUM_URL = "https://forum.matrp.ru/index.php?forums/test.1/"
+
+
+def page_kind(html: str) -> str:
+    if "structItem" in html:
+        return "forum"
+    if "js-selectToQuote" in html or "js-post-" in html:
+        return "thread"
+    return ""
+
+
+def parse(backend, kind: str, html: str):
+    if kind == "forum":
+        return backend.forum_topics(html, FORUM_URL)
+    return backend.thread_posts(html, PAGE_URL)
+
+
+def first_diff(a, b) -> str:
+    if len(a) != len(b):
+        return f"{len(a)} vs {len(b)} items"
+    for i, (x, y) in enumerate(zip(a, b)):
+        for k in sorted(set(x) | set(y)):
+            if x.get(k) != y.get(k):
+                return f"item {i} field {k!r}: {x.get(k)!r} vs {y.get(k)!r}"
+    return ""
+
+
+def collect(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += [os.path.join(p, f) for f in sorted(os.listdir(p)) if f.endswith((".html", ".htm"))]
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+
+def main(argv) -> int:
+    files = collect(argv or [DEFAULT_DIR])
+    names = [n for n in BACKENDS if available(n)]
+    if not files:
+        print("нет страниц для проверки")
+        return 0
+    print("бэкенды:", ", ".join(names))
+
+    spent = {n: 0.0 for n in names}
+    bad = 0
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        kind = page_kind(html)
+        if not kind:
+            continue
+        results = {}
+        for n in names:
+            t0 = time.perf_counter()
+            results[n] = parse(get_backend(n), kind, html)
+            spent[n] += time.perf_counter() - t0
+        ref = results[names[-1]]  # html.parser — эталон
+        diffs = [(n, first_diff(ref, results[n])) for n in names[:-1]]
+        diffs = [(n, d) for n, d in diffs if d]
+        for n, d in diffs:
+            print(f"DIFF {os.path.basename(path)} [{kind}] {n}: {d}")
+        if diffs:
+            bad += 1
+        else:
+            print(f"ok   {os.path.basename(path)} [{kind}] {len(ref)}")
+
+    for n in names:
+        print(f"{n:12s} {spent[n] * 1000:8.1f} ms")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
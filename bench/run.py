@@ -0,0 +1,218 @@
+# bench/run.py
+"""
+Замер скорости разбора на сохранённых страницах форума (bench/corpus).
+
+    python bench/run.py [--parser auto|selectolax|lxml|html.parser] [--repeat N]
+                        [--save baseline.json] [--compare baseline.json] [--threshold 0.2]
+                        [папка или файлы .html ...]
+
+Что меряется:
+  thread   — parse_thread_posts по страницам тем
+  forum    — parse_forum_topics по страницам разделов
+  post_id  — extract_post_id_from_article по каждому <article class="message">
+  type     — разбор ссылки (analyze_url без lru_cache) по всем ссылкам со страниц
+  profile  — разбор профиля (/profile) по страницам профилей
+
+Для каждой цели — страниц (или вызовов) в секунду, МБ/с и пик памяти (tracemalloc,
+отдельным прогоном, чтобы не мешать замеру времени).
+
+--save пишет результат в JSON, --compare сравнивает с таким файлом: цель, ставшая
+медленнее больше чем на threshold (по умолчанию 20%), помечается SLOWER, код выхода 1.
+Время зависит от машины — сравнивать имеет смысл только замеры с одного компьютера.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(ROOT, "bench", "corpus")
+PAGE_URL = "https://forum.matrp.ru/index.php?threads/test.1/"
+FORUM_URL = "https://forum.matrp.ru/index.php?forums/test.1/"
+PROFILE_URL = "https://forum.matrp.ru/index.php?members/user.123/"
+
+_ARTICLE_START_RE = re.compile(r'<article\b[^>]*class="message[ "]')
+_HREF_RE = re.compile(r'href="([^"]+)"')
+
+
+def page_kind(html: str) -> str:
+    if "structItem" in html:
+        return "forum"
+    if "js-selectToQuote" in html or "js-post-" in html:
+        return "thread"
+    if "memberHeader" in html:
+        return "profile"
+    return ""
+
+
+def collect(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += [os.path.join(p, f) for f in sorted(os.listdir(p)) if f.endswith((".html", ".htm"))]
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+
+def split_articles(html: str):
+    """Куски HTML от одного <article class="message ..."> до следующего."""
+    starts = [m.start() for m in _ARTICLE_START_RE.finditer(html)]
+    return [html[a:b] for a, b in zip(starts, starts[1:] + [len(html)])]
+
+
+class _ProfileTracker:
+    """Вместо ForumTracker для _parse_profile: отдаёт страницу из корпуса, без кэша."""
+    page_cache = None
+
+    def __init__(self):
+        self.html = ""
+
+    def fetch_html(self, url):
+        return self.html
+
+
+def build_targets(pages):
+    """pages: {kind: [html, ...]} -> {цель: (функция(item), [item, ...], байт на проход)}."""
+    from bot.command_handler import CommandHandler
+    from bot.forum_tracker import parse_forum_topics, parse_thread_posts
+    from bot.utils import analyze_url, extract_post_id_from_article, normalize_url
+
+    handler = CommandHandler.__new__(CommandHandler)
+    handler.tracker = _ProfileTracker()
+
+    def profile(html):
+        handler.tracker.html = html
+        return handler._parse_profile(PROFILE_URL)
+
+    all_html = pages["thread"] + pages["forum"] + pages["profile"]
+    articles = [a for h in pages["thread"] for a in split_articles(h)]
+    urls = sorted({normalize_url(u) for h in all_html for u in _HREF_RE.findall(h) if "index.php?" in u})
+
+    def size(items):
+        return sum(len(x.encode("utf-8")) for x in items)
+
+    targets = {
+        "thread": (lambda h: parse_thread_posts(h, PAGE_URL), pages["thread"]),
+        "forum": (lambda h: parse_forum_topics(h, FORUM_URL), pages["forum"]),
+        "post_id": (extract_post_id_from_article, articles),
+        # detect_type идёт через lru_cache: после прогрева мерились бы только попадания в кэш
+        "type": (lambda u: analyze_url.__wrapped__(u).type, urls),
+        "profile": (profile, pages["profile"]),
+    }
+    return {k: (fn, items, size(items)) for k, (fn, items) in targets.items() if items}
+
+
+def measure(fn, items, nbytes, repeat):
+    for x in items:  # прогрев: импорты, кэши селекторов
+        fn(x)
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        for x in items:
+            fn(x)
+        runs.append(time.perf_counter() - t0)
+    best = min(runs)
+
+    gc.collect()
+    tracemalloc.start()
+    for x in items:
+        fn(x)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": len(items),
+        "bytes": nbytes,
+        "best_s": best,
+        "median_s": statistics.median(runs),
+        "per_s": len(items) / best if best else 0.0,
+        "mb_s": nbytes / best / 1e6 if best else 0.0,
+        "peak_kb": peak / 1024,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Строки отчёта и число целей, ставших медленнее порога."""
+    lines, slower = [], 0
+    for name, r in results.items():
+        old = baseline.get("targets", {}).get(name)
+        if not old or not old.get("best_s"):
+            lines.append(f"{name:8s} нет в базовом замере")
+            continue
+        ratio = r["best_s"] / old["best_s"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  SLOWER"
+            slower += 1
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        lines.append(f"{name:8s} {old['best_s'] * 1000:9.2f} -> {r['best_s'] * 1000:9.2f} ms  x{ratio:.2f}{mark}")
+    return lines, slower
+
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description="Замер скорости разбора страниц форума")
+    ap.add_argument("paths", nargs="*", default=[DEFAULT_DIR])
+    ap.add_argument("--parser", help="HTML_PARSER для замера (по умолчанию — из настроек)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--save", metavar="JSON")
+    ap.add_argument("--compare", metavar="JSON")
+    ap.add_argument("--threshold", type=float, default=0.2)
+    args = ap.parse_args(argv)
+
+    if args.parser:
+        os.environ["HTML_PARSER"] = args.parser  # до импорта bot: настройка читается при импорте
+    sys.path.insert(0, ROOT)
+    from bot.parser_backend import resolve
+
+    pages = {"thread": [], "forum": [], "profile": []}
+    for path in collect(args.paths):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        kind = page_kind(html)
+        if kind:
+            pages[kind].append(html)
+    if not any(pages.values()):
+        print("нет страниц для замера")
+        return 0
+
+    backend = resolve()
+    print(f"парсер: {backend}, страниц: тем {len(pages['thread'])}, разделов {len(pages['forum'])}, "
+          f"профилей {len(pages['profile'])}, повторов {args.repeat}")
+    results = {}
+    for name, (fn, items, nbytes) in build_targets(pages).items():
+        r = results[name] = measure(fn, items, nbytes, max(1, args.repeat))
+        print(f"{name:8s} {r['items']:5d} шт  {r['best_s'] * 1000:9.2f} ms  {r['per_s']:10.1f} /s  "
+              f"{r['mb_s']:7.2f} MB/s  пик {r['peak_kb']:8.1f} KB")
+
+    report = {"parser": backend, "python": sys.version.split()[0], "repeat": args.repeat, "targets": results}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"сохранено: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parser") != backend:
+            print(f"внимание: базовый замер сделан с парсером {baseline.get('parser')}")
+        lines, slower = compare(results, baseline, args.threshold)
+        print(f"сравнение с {args.compare} (порог {args.threshold:.0%}):")
+        for line in lines:
+            print("  " + line)
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -8,6 +8,7 @@ import requests
 from .utils import normalize_url, log_info, log_error
 import datetime
 from .forum_tracker import build_cookies  # reuse cookie builder if needed
+from .rate_limit import LimitedSession
 
 try:
     from config import FORUM_BASE, XF_LOGIN, XF_PASS
@@ -20,7 +21,7 @@ class Account:
     def __init__(self, login: str = XF_LOGIN, password: str = XF_PASS, session: Optional[requests.Session] = None):
         self.login = login
         self.password = password
-        self.session = session or requests.Session()
+        self.session = session or LimitedSession()
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (ForumTracker/1.0)"
         })
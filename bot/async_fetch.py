@@ -0,0 +1,135 @@
+# bot/async_fetch.py
+"""
+Асинхронный движок загрузки страниц форума (aiohttp).
+
+Скачивает все страницы цикла параллельно (с ограничением числа соединений
+на один хост), а обработку каждой страницы отдаёт в пул потоков — так
+парсинг и отправка уведомлений по разным ссылкам тоже идут одновременно.
+
+Если aiohttp не установлен — is_available() вернёт False, и трекер
+останется на старом последовательном режиме.
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+from .utils import log_info, log_error, normalize_url
+from .rate_limit import RETRY_STATUSES
+from .singleflight import inflight
+
+
+def is_available() -> bool:
+    return aiohttp is not None
+
+
+class AsyncFetchEngine:
+    """
+    engine.run(jobs, handler):
+      jobs    — {key: url для загрузки}
+      handler — handler(key, html, status), вызывается в пуле потоков;
+                html == "" если страницу скачать не удалось,
+                html is None если страница не изменилась (нужен validators);
+                status — HTTP-код последней попытки (0 — ответа нет).
+      validators — ValidatorCache для условных запросов (необязательно).
+      limiter    — ForumRateLimiter: общий с остальными запросами лимит и пауза на 429/503.
+      pool       — готовый пул потоков для handler (живёт дольше одного run и не закрывается);
+                   без него на каждый run создаётся свой пул на workers потоков.
+
+    Загрузки идут через общий singleflight.inflight: если ту же страницу уже качает
+    fetch_html (команда, другой трекер), ждём её результат вместо второго запроса.
+    """
+
+    def __init__(self, headers: Optional[dict] = None, cookies: Optional[dict] = None,
+                 per_host: int = 4, total: int = 16, timeout: int = 15, workers: int = 8,
+                 validators=None, limiter=None, retries: int = 3,
+                 pool: Optional[ThreadPoolExecutor] = None):
+        self.headers = dict(headers or {})
+        self.cookies = dict(cookies or {})
+        self.per_host = max(1, int(per_host))
+        self.total = max(self.per_host, int(total))
+        self.timeout = timeout
+        self.workers = max(1, int(workers))
+        self.validators = validators
+        self.limiter = limiter
+        self.retries = retries
+        self.pool = pool
+
+    def run(self, jobs: Dict[str, str], handler: Callable[[str, Optional[str], int], None]):
+        if not jobs:
+            return
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed")
+        asyncio.run(self._run(jobs, handler))
+
+    async def _run(self, jobs: Dict[str, str], handler):
+        connector = aiohttp.TCPConnector(limit=self.total, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        pool = self.pool or ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tracker")
+        try:
+            async with aiohttp.ClientSession(headers=self.headers, cookies=self.cookies,
+                                             connector=connector, timeout=timeout) as s:
+                await asyncio.gather(
+                    *(self._job(s, pool, key, url, handler) for key, url in jobs.items())
+                )
+        finally:
+            if pool is not self.pool:
+                pool.shutdown(wait=True)
+
+    async def _job(self, s, pool, key: str, url: str, handler):
+        status, html = await self.fetch(s, url)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(pool, handler, key, html, status)
+        except Exception as e:
+            log_error(f"[ASYNC] handler error for {key}: {e}")
+
+    async def fetch(self, s, url: str) -> Tuple[int, Optional[str]]:
+        """(status, html) — как ForumTracker.fetch_page."""
+        try:
+            key = normalize_url(url)
+        except Exception:
+            key = url
+        accept = None if self.validators else (lambda res: res[1] is not None)
+        return await inflight.ado(key, lambda: self._fetch(s, url), accept=accept)
+
+    async def _fetch(self, s, url: str) -> Tuple[int, Optional[str]]:
+        status = 0
+        for attempt in range(self.retries + 1):
+            if self.limiter:
+                async with self.limiter.aslot():
+                    status, text, retry_after = await self._get(s, url)
+            else:
+                status, text, retry_after = await self._get(s, url)
+            if status in RETRY_STATUSES and self.limiter:
+                self.limiter.penalize(retry_after)
+                continue
+            if self.limiter and status:
+                self.limiter.reward()
+            return status, text
+        return status, ""
+
+    async def _get(self, s, url: str):
+        """(status, html | None | "", Retry-After)"""
+        log_info(f"[ASYNC] GET {url}")
+        headers = self.validators.request_headers(url) if self.validators else None
+        try:
+            async with s.get(url, headers=headers) as r:
+                if r.status == 304 and self.validators:
+                    return r.status, None, None
+                if r.status != 200:
+                    log_info(f"[ASYNC] HTTP {r.status} for {url}")
+                    return r.status, "", r.headers.get("Retry-After")
+                text = await r.text(errors="replace")
+                if self.validators and not self.validators.update(url, r.headers, text):
+                    return r.status, None, None
+                return r.status, text, None
+        except Exception as e:
+            log_info(f"[ASYNC] fetch error for {url}: {e!r}")
+            return 0, "", None
@@ -0,0 +1,80 @@
+# bot/check_coordinator.py
+"""
+Координатор ручных проверок (/check).
+
+Одновременно идёт не больше одного цикла проверки: и полный (/check),
+и плановый из ForumTracker._loop берут общий замок cycle().
+
+Запросы /check, пришедшие во время проверки, не запускают новую —
+все они ждут одну «следующую» проверку, которая начнётся сразу после
+текущей. Сколько бы /check ни пришло, в работе максимум одна проверка
+и одна в очереди.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Optional
+
+
+class CheckTicket:
+    """Запрос на проверку; wait() ждёт её результата."""
+
+    def __init__(self, joined: bool = False):
+        # joined=True — в момент запроса уже шла проверка, эта начнётся после неё
+        self.joined = joined
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Результат проверки; None — не дождались за timeout. Ошибку проверки пробрасывает."""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _finish(self, result: Any = None, error: Optional[BaseException] = None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class CheckCoordinator:
+    def __init__(self, run: Callable[[], Any]):
+        self._run = run
+        self._cycle = threading.Lock()
+        self._lock = threading.Lock()
+        self._running: Optional[CheckTicket] = None
+        self._next: Optional[CheckTicket] = None
+
+    def cycle(self):
+        """Замок одного цикла проверки: `with coordinator.cycle(): ...`."""
+        return self._cycle
+
+    def request(self) -> CheckTicket:
+        with self._lock:
+            if self._running is None:
+                self._running = CheckTicket()
+                threading.Thread(target=self._worker, daemon=True).start()
+                return self._running
+            if self._next is None:
+                # текущая проверка могла уже пройти нужную ссылку — нужна ещё одна
+                self._next = CheckTicket(joined=True)
+            return self._next
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                ticket = self._running
+            try:
+                ticket._finish(result=self._run())
+            except Exception as e:
+                ticket._finish(error=e)
+            with self._lock:
+                self._running, self._next = self._next, None
+                if self._running is None:
+                    return
@@ -0,0 +1,109 @@
+# bot/circuit.py
+"""
+Предохранитель (circuit breaker) для отслеживаемых ссылок.
+
+Удалённые темы, закрытые разделы и переехавшие ссылки падают каждый цикл
+и тратят время на таймауты. Для каждой ссылки ведём состояние:
+  closed    — всё нормально, проверяем как обычно;
+  open      — после threshold ошибок подряд ссылку не трогаем cooldown секунд;
+  half_open — cooldown прошёл, делаем одну пробную проверку (не дольше
+              probe_timeout: пропавшая проба не блокирует ссылку навсегда).
+Каждое новое открытие подряд удлиняет паузу (COOLDOWNS). Состояние
+хранится в БД (таблица url_health), чтобы переживать перезапуск бота.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# паузы после 1-го, 2-го, ... открытия подряд: 5 мин, 15 мин, 1 ч, 6 ч, сутки
+COOLDOWNS = (300, 900, 3600, 6 * 3600, 24 * 3600)
+
+
+class CircuitBreaker:
+    """
+    allow(url)   — можно ли сейчас проверять ссылку;
+    probing(url) — идёт ли по ссылке пробная проверка (half_open);
+    failure(url) — ошибка; вернёт True, если ссылка только что «сломалась» и
+                   подписчиков ещё не предупреждали;
+    success(url) — успех; вернёт True, если ссылка починилась после предупреждения.
+    """
+
+    def __init__(self, threshold: int = 3, cooldowns=COOLDOWNS,
+                 load: Optional[Callable[[], Dict[str, dict]]] = None,
+                 save: Optional[Callable[[str, dict], None]] = None,
+                 clock: Callable[[], float] = time.time, probe_timeout: float = 600.0):
+        self.threshold = max(1, threshold)
+        self.cooldowns = tuple(cooldowns) or COOLDOWNS
+        self.probe_timeout = probe_timeout
+        self._save = save
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._items: Dict[str, dict] = {}
+        if load:
+            try:
+                self._items = dict(load() or {})
+            except Exception:
+                self._items = {}
+        for st in self._items.values():
+            # пробная проверка прервалась перезапуском — просто ждём конца паузы
+            if st.get("state") == HALF_OPEN:
+                st["state"] = OPEN
+
+    def _persist(self, url: str, st: dict):
+        if self._save:
+            try:
+                self._save(url, dict(st))
+            except Exception:
+                pass
+
+    def allow(self, url: str) -> bool:
+        with self._lock:
+            st = self._items.get(url)
+            if not st or st["state"] == CLOSED:
+                return True
+            now = self._clock()
+            if st["state"] == HALF_OPEN:
+                # пробная проверка уже идёт; если её результат так и не пришёл — пробуем снова
+                if now < st.get("probe_until", 0.0):
+                    return False
+            elif now < st["open_until"]:
+                return False
+            st["state"] = HALF_OPEN
+            st["probe_until"] = now + self.probe_timeout
+        return True
+
+    def probing(self, url: str) -> bool:
+        with self._lock:
+            return self._items.get(url, {}).get("state") == HALF_OPEN
+
+    def failure(self, url: str) -> bool:
+        with self._lock:
+            st = self._items.setdefault(url, {
+                "state": CLOSED, "failures": 0, "trips": 0, "open_until": 0.0, "notified": 0,
+            })
+            st["failures"] += 1
+            if st["state"] == HALF_OPEN or st["failures"] >= self.threshold:
+                cooldown = self.cooldowns[min(st["trips"], len(self.cooldowns) - 1)]
+                st["trips"] += 1
+                st["state"] = OPEN
+                st["open_until"] = self._clock() + cooldown
+            notify = st["state"] == OPEN and not st["notified"]
+            if notify:
+                st["notified"] = 1
+            snapshot = dict(st)
+        self._persist(url, snapshot)
+        return notify
+
+    def success(self, url: str) -> bool:
+        with self._lock:
+            st = self._items.pop(url, None)
+        if not st:
+            return False
+        self._persist(url, {})
+        return bool(st.get("notified"))
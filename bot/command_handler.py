@@ -10,18 +10,20 @@ import traceback
 import sqlite3
 import os
 import json
+import threading
 from typing import List, Tuple, Optional, Dict
 
 # локальные импорты
 from .storage import (
     add_track, remove_track, list_tracks,
     add_warn, get_warns, clear_warns,
-    add_ban, remove_ban, is_banned, update_last
+    add_ban, remove_ban, is_banned, seed_last
 )
 from .deepseek_ai import ask_ai
 from .permissions import is_admin
-from .utils import normalize_url, detect_type
-from .forum_tracker import ForumTracker, parse_forum_topics
+from .utils import normalize_url, analyze_url
+from .forum_tracker import ForumTracker, forum_seed_last
+from .parser_backend import make_soup
 from config import FORUM_BASE
 
 # путь к БД (для stats)
@@ -31,6 +33,9 @@ DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "bot_data.db")
 TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 TEMPLATES_FILE = os.path.join(TEMPLATES_DIR, "templates.json")
 
+# сколько секунд /check ждёт итога проверки, чтобы сообщить его в чат
+CHECK_WAIT_SEC = 300
+
 
 # ----------------- Утилиты шаблонов (JSON) -----------------
 def _ensure_templates_file():
@@ -286,12 +291,13 @@ class CommandHandler:
         # ---------------------------------------------------------
         clean_url = url.split("&")[0]
 
-        if "/index.php?forums/" in clean_url:
-            typ = "forum"
-        elif "/index.php?threads/" in clean_url:
-            typ = "thread"
-        else:
+        info = analyze_url(clean_url)
+        typ = info.type
+        if not (info.thread_id or info.forum_id):
             return self.vk.send(peer_id, "❌ Эта ссылка не является ни разделом, ни темой.")
+        if info.post_link:
+            # в ссылке на пост нет id темы: страницы и лента «Новые сообщения» по ней не сработают
+            return self.vk.send(peer_id, "❌ Это ссылка на сообщение. Пришлите ссылку на саму тему (…/threads/…).")
 
         # ---------------------------------------------------------
         #       ПОЛУЧАЕМ ПОСЛЕДНИЙ ID
@@ -305,24 +311,9 @@ class CommandHandler:
 
             # Если это раздел — берём TID самой последней темы
             elif typ == "forum":
-                html = self.tracker.fetch_html(clean_url)
-                topics = parse_forum_topics(html, clean_url)
-                if topics:
-                    # сортируем по дате → если нет date, сортируем по tid
-                    sortable = []
-                    for t in topics:
-                        dt = t.get("date") or ""
-                        tid = int(t.get("tid", 0))
-                        sortable.append((dt, tid, t))
-                    
-                    sortable.sort(key=lambda x: (x[0], x[1]))
-
-                    last_topic = sortable[-1][2]
-                    last_tid = sortable[-1][1]
-                    last_date = sortable[-1][0]
-
-                    # сохраняем tid;;date
-                    latest = f"{last_tid};;{last_date}"
+                # всё, что сейчас в разделе, считаем виденным
+                topics = self.tracker.get_topics(clean_url, feed_ok=True)
+                latest = forum_seed_last(topics or [])
 
         except Exception:
             latest = None
@@ -334,7 +325,8 @@ class CommandHandler:
 
         if latest:
             try:
-                update_last(peer_id, clean_url, str(latest))
+                # если ссылку уже отслеживает другой чат — продолжаем с её общего last
+                seed_last(clean_url, latest)
             except Exception:
                 pass
 
@@ -369,11 +361,31 @@ class CommandHandler:
     def cmd_check(self, peer_id):
         try:
             self.vk.send(peer_id, "⏳ Запуск проверки…")
-            ok = self.vk.trigger_check()
-            self.vk.send(peer_id, "✅ Проверка запущена." if ok else "❌ Ошибка.")
+            ticket = self.vk.trigger_check()
+            if not ticket:
+                return self.vk.send(peer_id, "❌ Ошибка.")
+            if getattr(ticket, "joined", False):
+                self.vk.send(peer_id, "⏳ Проверка уже идёт — следующая начнётся сразу после неё.")
+            else:
+                self.vk.send(peer_id, "✅ Проверка запущена.")
+            if hasattr(ticket, "wait"):
+                # ждём итог в отдельном потоке, чтобы не держать longpoll
+                threading.Thread(target=self._report_check, args=(peer_id, ticket), daemon=True).start()
         except Exception as e:
             self.vk.send(peer_id, f"Ошибка trigger_check: {e}")
 
+    def _report_check(self, peer_id, ticket):
+        try:
+            res = ticket.wait(CHECK_WAIT_SEC)
+        except Exception as e:
+            return self.vk.send(peer_id, f"❌ Проверка завершилась с ошибкой: {e}")
+        if res is None:
+            return self.vk.send(peer_id, "⌛ Проверка ещё идёт — новые сообщения придут сами.")
+        self.vk.send(
+            peer_id,
+            f"✅ Проверка завершена: ссылок {len(res)}, новых сообщений/тем {sum(res.values())}."
+        )
+
     # -------------------- /checkfa (ручной fetch posts) --------------------
     def cmd_checkfa(self, peer_id, parts):
         if len(parts) < 2:
@@ -432,13 +444,7 @@ class CommandHandler:
         except Exception as e:
             return self.vk.send(peer_id, f"Ошибка: {e}")
         if res.get("ok"):
-            try:
-                if hasattr(self.tracker, 'fetch_latest_post_id'):
-                    latest = self.tracker.fetch_latest_post_id(url)
-                    if latest:
-                        update_last(peer_id, url, str(latest))
-            except Exception:
-                pass
+            # last не трогаем: он общий для всех чатов темы, свой пост придёт как обычный новый
             return self.vk.send(peer_id, "✅ Сообщение отправлено.")
         else:
             return self.vk.send(peer_id, f"❌ Ошибка: {res.get('error')}")
@@ -451,12 +457,11 @@ class CommandHandler:
         if "forums" not in url.lower():
             return self.vk.send(peer_id, "❌ Это не ссылка на раздел.")
         try:
-            html = self.tracker.fetch_html(url)
+            topics = self.tracker.get_topics(url, feed_ok=True)
         except Exception as e:
             return self.vk.send(peer_id, f"Ошибка fetch_html: {e}")
-        if not html:
+        if topics is None:
             return self.vk.send(peer_id, "❌ Не удалось загрузить HTML раздела.")
-        topics = parse_forum_topics(html, url)
         if not topics:
             return self.vk.send(peer_id, "⚠️ Темы не найдены.")
         # берём первые 5 (в порядке parse)
@@ -475,12 +480,11 @@ class CommandHandler:
         if "forums" not in url.lower():
             return self.vk.send(peer_id, "❌ Это не ссылка на раздел.")
         try:
-            html = self.tracker.fetch_html(url)
+            topics = self.tracker.get_topics(url, feed_ok=True)
         except Exception as e:
             return self.vk.send(peer_id, f"Ошибка fetch_html: {e}")
-        if not html:
+        if topics is None:
             return self.vk.send(peer_id, "❌ Не удалось загрузить раздел.")
-        topics = parse_forum_topics(html, url)
         if not topics:
             return self.vk.send(peer_id, "⚠️ Темы не найдены.")
         # отправляем чанками
@@ -551,14 +555,7 @@ class CommandHandler:
         except Exception as e:
             return self.vk.send(peer_id, f"Ошибка отправки: {e}")
         if res.get("ok"):
-            # обновляем last (если нужно)
-            try:
-                if hasattr(self.tracker, "fetch_latest_post_id"):
-                    latest = self.tracker.fetch_latest_post_id(url)
-                    if latest:
-                        update_last(peer_id, url, str(latest))
-            except Exception:
-                pass
+            # last не трогаем: он общий для всех чатов темы, свой пост придёт как обычный новый
             return self.vk.send(peer_id, f"✅ Шаблон '{name}' отправлен в {url}")
         else:
             return self.vk.send(peer_id, f"❌ Ошибка постинга: {res.get('error')}")
@@ -599,11 +596,16 @@ class CommandHandler:
         Простой парсер страницы профиля XenForo: пытается извлечь имя, id, registered, message_count, about.
         Если профиль недоступен — возвращает None.
         """
+        cache = getattr(self.tracker, "page_cache", None)
+        if cache is not None:
+            cached = cache.get("profile", url)
+            if cached is not None:
+                return cached
         try:
             html = self.tracker.fetch_html(url)
             if not html:
                 return None
-            soup = __import__("bs4").BeautifulSoup(html, "html.parser")
+            soup = make_soup(html)
 
             # username
             uname = None
@@ -643,13 +645,16 @@ class CommandHandler:
             if about_el:
                 about = about_el.get_text(" ", strip=True)
 
-            return {
+            info = {
                 "username": uname or "",
                 "user_id": user_id or "",
                 "registered": registered or "",
                 "message_count": msg_count or "",
                 "about": about or ""
             }
+            if cache is not None:
+                cache.put("profile", url, info)
+            return info
         except Exception:
             return None
 
@@ -764,14 +769,11 @@ class CommandHandler:
             return self.vk.send(peer_id, "❌ Это не ссылка на раздел.")
 
         try:
-            html = self.tracker.fetch_html(url)
+            topics = self.tracker.get_topics(url)
         except Exception as e:
             return self.vk.send(peer_id, f"Ошибка fetch_html: {e}")
-
-        if not html:
+        if topics is None:
             return self.vk.send(peer_id, "❌ Не удалось загрузить страницу.")
-
-        topics = parse_forum_topics(html, url)
         if not topics:
             return self.vk.send(peer_id, "⚠️ Темы не найдены.")
 
@@ -801,10 +803,9 @@ class CommandHandler:
             return self.vk.send(peer_id, f"❌ Только {FORUM_BASE}")
 
         try:
-            html = self.tracker.fetch_html(url)
-            if not html:
+            topics = self.tracker.get_topics(url)
+            if topics is None:
                 return self.vk.send(peer_id, "❌ Не удалось загрузить страницу (check cookies).")
-            topics = parse_forum_topics(html, url)
             if not topics:
                 return self.vk.send(peer_id, "⚠️ Темы не найдены.")
         # покажем первые 10 с created
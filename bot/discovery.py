@@ -0,0 +1,104 @@
+# bot/discovery.py
+"""
+Поиск изменившихся тем через ленту «Новые сообщения» XenForo (whats-new/posts).
+
+Лента отсортирована по времени последнего сообщения, поэтому достаточно
+листать её, пока не дойдём до времени прошлого цикла. На выходе — множество
+id тем, в которых что-то появилось; остальные темы трекер в этом цикле не качает.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Callable, List, Optional, Set, Tuple
+
+from .utils import log_info
+
+_ITEM_SPLIT_RE = re.compile(r'js-threadListItem-(\d+)')
+_LATEST_RE = re.compile(r'<time[^>]*structItem-latestDate[^>]*data-time=["\'](\d+)["\']')
+_ANY_TIME_RE = re.compile(r'data-time=["\'](\d+)["\']')
+_FIND_ID_RE = re.compile(r'whats-new/posts/(\d+)/')
+
+
+def parse_whats_new(html: str) -> List[Tuple[int, int]]:
+    """[(tid, unix-время последнего сообщения)] в порядке ленты."""
+    out: List[Tuple[int, int]] = []
+    if not html:
+        return out
+    parts = _ITEM_SPLIT_RE.split(html)
+    # parts: [до первого, tid1, блок1, tid2, блок2, ...]
+    for i in range(1, len(parts) - 1, 2):
+        tid, block = int(parts[i]), parts[i + 1]
+        m = _LATEST_RE.search(block)
+        if m:
+            ts = int(m.group(1))
+        else:
+            times = [int(t) for t in _ANY_TIME_RE.findall(block)]
+            ts = max(times) if times else 0
+        out.append((tid, ts))
+    return out
+
+
+class ChangeDiscovery:
+    """
+    discover() -> set(tid) изменившихся тем или None, если сказать нельзя
+    (первый запуск, лента недоступна, изменений больше, чем max_pages страниц) —
+    тогда трекер проверяет все ссылки, как раньше.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[str]], list_url: str,
+                 max_pages: int = 3, overlap_sec: int = 120):
+        self.fetch = fetch
+        self.list_url = list_url
+        self.max_pages = max(1, max_pages)
+        # запас по времени: сообщения, попавшие в ленту с задержкой, не теряются
+        self.overlap_sec = overlap_sec
+        self._since = 0
+        self._lock = threading.Lock()
+
+    def _page_url(self, first_html: str, page: int) -> Optional[str]:
+        m = _FIND_ID_RE.search(first_html or "")
+        if not m:
+            return None
+        root = self.list_url.split("whats-new/")[0]
+        return f"{root}whats-new/posts/{m.group(1)}/page-{page}"
+
+    def discover(self) -> Optional[Set[int]]:
+        with self._lock:
+            since = self._since
+            border = since - self.overlap_sec
+            changed: Set[int] = set()
+            newest = since
+            first_html = ""
+            complete = False
+
+            for page in range(1, self.max_pages + 1):
+                url = self.list_url if page == 1 else self._page_url(first_html, page)
+                if not url:
+                    break
+                html = self.fetch(url)
+                if not html:
+                    log_info(f"[DISCOVERY] cannot fetch {url}")
+                    return None
+                if page == 1:
+                    first_html = html
+                items = parse_whats_new(html)
+                if not items:
+                    complete = page > 1
+                    break
+                for tid, ts in items:
+                    newest = max(newest, ts)
+                    if ts >= border:
+                        changed.add(tid)
+                if min(ts for _, ts in items) < border or f"page-{page + 1}" not in html:
+                    # дошли до прошлого цикла или лента кончилась
+                    complete = True
+                    break
+
+            if newest > self._since:
+                self._since = newest
+            if not since or not complete:
+                # первый запуск или изменений слишком много — нужна полная проверка
+                return None
+            log_info(f"[DISCOVERY] changed threads: {len(changed)}")
+            return changed
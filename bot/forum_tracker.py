@@ -6,9 +6,8 @@
 и сообщений, добавлен безопасный лог и отладочные хелперы.
 
 Важно: ожидает, что в проекте есть:
- - bot/utils.py с функциями: normalize_url, detect_type, extract_thread_id,
-   extract_post_id_from_article, log_info, log_error
- - bot/storage.py с list_all_tracks и update_last
+ - bot/utils.py с функциями: analyze_url, normalize_url, log_info, log_error
+ - bot/storage.py с registry и StateBuffer
  - config.py (опционально) с FORUM_BASE, XF_USER, XF_SESSION, XF_TFA_TRUST, POLL_INTERVAL_SEC, XF_CSRF
 """
 from __future__ import annotations
@@ -16,16 +15,26 @@ from __future__ import annotations
 import re
 import threading
 import time
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from urllib.parse import urljoin
 from .utils import (
-    normalize_url, detect_type,
-    extract_thread_id, extract_post_id_from_article,
-    log_info, log_error
+    analyze_url, normalize_url,
+    log_info, log_error, get_setting, thread_page_url
 )
-from .storage import list_all_tracks, update_last
+from .storage import (
+    registry, get_thread_pages, load_url_health, load_fingerprints, StateBuffer, Watermark
+)
+from . import async_fetch, parse_pool, rss
+from .discovery import ChangeDiscovery
+from .scheduler import PollScheduler, SystemClock
+from .rate_limit import LimitedSession, forum_limiter
+from .circuit import CircuitBreaker
+from .singleflight import inflight
+from .http_cache import ValidatorCache, region_digest
+from .page_cache import page_cache
+from .check_coordinator import CheckCoordinator
+from .parser_backend import make_soup, scan_post_ids
 import traceback
 import datetime
 
@@ -50,6 +59,41 @@ try:
 except Exception:
     POLL = DEFAULT_POLL
 
+# режим загрузки в check_all: "async" (aiohttp, параллельно) или "sync" (по очереди)
+FETCH_MODE = get_setting("FETCH_MODE", "async").lower()
+# максимум одновременных соединений к одному хосту / всего
+FETCH_PER_HOST = get_setting("FETCH_PER_HOST", 4)
+FETCH_TOTAL = get_setting("FETCH_TOTAL", 16)
+# потоки для обработки скачанных страниц (парсинг + уведомления)
+PROCESS_WORKERS = get_setting("PROCESS_WORKERS", 8)
+# постов на странице темы (настройка форума XenForo)
+POSTS_PER_PAGE = get_setting("POSTS_PER_PAGE", 20)
+# сколько новых страниц темы догружать за один цикл, если тема выросла сразу на несколько
+THREAD_CATCHUP_PAGES = max(1, get_setting("THREAD_CATCHUP_PAGES", 5))
+# RSS-лент (index.rss): "auto" — пробовать ленту, при ошибке откатываться на HTML; "html" — не использовать
+FEED_MODE = get_setting("FEED_MODE", "auto").lower()
+# через сколько секунд снова пробовать ленту, которая не сработала
+FEED_RETRY_SEC = get_setting("FEED_RETRY_SEC", 6 * 3600)
+# поиск изменившихся тем через «Новые сообщения» перед каждым циклом
+DISCOVERY_ENABLED = get_setting("DISCOVERY_ENABLED", True)
+DISCOVERY_PATH = get_setting("DISCOVERY_PATH", "/index.php?whats-new/posts/")
+DISCOVERY_MAX_PAGES = get_setting("DISCOVERY_MAX_PAGES", 3)
+# раз в сколько циклов всё равно проверять все темы
+DISCOVERY_FULL_EVERY = get_setting("DISCOVERY_FULL_EVERY", 30)
+# границы адаптивного интервала проверки одной ссылки и случайный разброс (доля)
+POLL_MIN_SEC = get_setting("POLL_MIN_SEC", POLL)
+POLL_MAX_SEC = get_setting("POLL_MAX_SEC", 600)
+POLL_JITTER = get_setting("POLL_JITTER", 0.1)
+# сколько tid выше порога помнить в last раздела (см. forum_mark)
+FORUM_SEEN_MAX = get_setting("FORUM_SEEN_MAX", 60)
+# после скольких ошибок подряд ссылка «ломается» и проверяется всё реже (bot/circuit.py)
+CIRCUIT_THRESHOLD = get_setting("CIRCUIT_THRESHOLD", 3)
+# ответы, которые говорят о самой ссылке (удалена / закрыта); остальные ошибки
+# (таймауты, 5xx, 429/503) считаются, только если другие ссылки цикла загрузились
+GONE_STATUSES = (403, 404, 410)
+# сколько изменений состояния (last, страницы тем, url_health) копить до записи в БД посреди цикла
+STATE_FLUSH_MAX = get_setting("STATE_FLUSH_MAX", 500)
+
 # ======================================================================
 #  Simple logging helpers
 # ======================================================================
@@ -73,6 +117,14 @@ def warn(msg: str):
 # COOKIE helpers and fetch
 # ======================================================================
 
+class FetchError(Exception):
+    """Страницу отслеживаемой ссылки не удалось скачать. status — HTTP-код (0 — нет ответа)."""
+
+    def __init__(self, url: str, status: int = 0):
+        super().__init__(url)
+        self.status = status
+
+
 def build_cookies() -> dict:
     """Return cookies dict (for requests)."""
     return {
@@ -87,203 +139,168 @@ def build_cookies() -> dict:
 #  Parsers: thread posts and forum topics
 # ======================================================================
 
-def parse_thread_posts(html: str, page_url: str, session=None) -> List[Dict]:
+_PAGE_NAV_RE = re.compile(r'class=["\']pageNav-page[^"\']*["\'][^>]*>\s*<a[^>]*>\s*(\d+)\s*<', re.I)
+
+
+def parse_page_count(html: str) -> int:
+    """Номер последней страницы темы по .pageNav (0 — навигации на странице нет)."""
+    nums = [int(n) for n in _PAGE_NAV_RE.findall(html or "")]
+    return max(nums) if nums else 0
+
+
+def parse_thread_posts(html: str, page_url: str, session=None, after_id: Optional[int] = None) -> List[Dict]:
     """
     Улучшенный парсер постов с поддержкой ПОСЛЕДНЕЙ страницы темы.
-    """
-    soup = BeautifulSoup(html or "", "html.parser")
+    Разбор — бэкендом из настройки HTML_PARSER (bot/parser_backend.py),
+    при PARSE_WORKERS > 0 — в пуле процессов (bot/parse_pool.py).
 
+    after_id — вернуть только посты с id больше него. id постов сначала ищутся
+    регуляркой; если новее нет — HTML вообще не разбирается, иначе разбирается
+    только кусок страницы, начиная с первого нового поста.
+    """
     # -----------------------------------------------------------
     # 1) Находим последнюю страницу
     # -----------------------------------------------------------
-    last_page = 1
-    pages = soup.select(".pageNav-page")
-    for p in pages:
-        try:
-            num = int(p.get_text(strip=True))
-            last_page = max(last_page, num)
-        except:
-            pass
+    last_page = max(1, parse_page_count(html))
 
     # -----------------------------------------------------------
     # 2) Загружаем последнюю страницу, если она есть
     # -----------------------------------------------------------
-    # Если есть последняя страница и передан session — грузим её
+    # Если есть последняя страница и передан session — грузим её.
+    # Трекер session не передаёт: страницы он догружает сам (ForumTracker._thread_tail).
     if last_page > 1 and session:
-        if page_url.endswith("/"):
-            url_last = f"{page_url}page-{last_page}/"
-        else:
-            url_last = f"{page_url}/page-{last_page}/"
+        url_last = thread_page_url(page_url, last_page)
 
         try:
             r = session.get(url_last, timeout=15)
             if r.status_code == 200:
                 html = r.text
-                soup = BeautifulSoup(html or "", "html.parser")
         except Exception as e:
             warn(f"Error loading last page: {e}")
 
+    if after_id is None:
+        return parse_pool.parse("thread", html, page_url)
 
-    # -----------------------------------------------------------
-    # 3) Парсим посты (как у тебя)
-    # -----------------------------------------------------------
-    posts_nodes = soup.select("article.message-body.js-selectToQuote")
-    if not posts_nodes:
-        posts_nodes = soup.select("article[data-post-id], article[id^='js-post-']")
-
-    out: List[Dict] = []
-
-    for msg in posts_nodes:
-        try:
-            pid = (
-                msg.get("data-lb-id")
-                or msg.get("data-id")
-                or msg.get("data-post-id")
-                or ""
-            )
-
-            if not pid:
-                art = msg.find_parent("article")
-                if art:
-                    pid = extract_post_id_from_article(str(art))
-
-            pid = str(pid)
-
-            user = (
-                msg.find_previous("a", class_="username")
-                or msg.find_previous("h4", class_="message-name")
-                or msg.find_previous("span", class_="username")
-            )
-            author = user.get_text(strip=True) if user else "Неизвестно"
-
-            t = msg.find_previous("time")
-            date = t.get("datetime") if t else ""
-
-            body = (
-                msg.select_one("div.bbWrapper")
-                or msg.select_one("div.message-userContent.lbContainer.js-lbContainer")
-                or msg.select_one("div.message-userContent")
-            )
-
-            text = body.get_text("\n", strip=True) if body else msg.get_text("\n", strip=True)
-            text = re.sub(r"\n{2,}", "\n", text).strip()
-
-            link = page_url.rstrip("/") + f"#post-{pid}"
-
-            out.append({
-                "id": pid,
-                "author": author,
-                "date": date,
-                "text": text,
-                "link": link,
-            })
-
-        except Exception as e:
-            warn(f"parse_thread_posts error: {e}")
-            continue
-
-    return out
-
+    ids = scan_post_ids(html)
+    if ids:
+        newer = [pos for pid, pos in ids if pid > after_id]
+        if not newer:
+            return []
+        html = html[min(newer):]
+    posts = parse_pool.parse("thread", html, page_url)
+    return [p for p in posts if _post_id_int(p) > after_id]
 
 
 def parse_forum_topics(html: str, base_url: str) -> List[Dict]:
     """
     Надёжный парсер тем MatRP. Возвращает список словарей с полями:
       tid, title, author, url, pinned, created
+    Разбор — бэкендом из настройки HTML_PARSER (bot/parser_backend.py),
+    при PARSE_WORKERS > 0 — в пуле процессов (bot/parse_pool.py).
     """
-    soup = BeautifulSoup(html or "", "html.parser")
-    topics: List[Dict] = []
+    return parse_pool.parse("forum", html, base_url)
 
-    blocks = soup.select(".structItem")
-    if not blocks:
-        return topics
 
-    seen = set()
+def _post_id_int(post: Dict) -> int:
+    try:
+        return int(post.get("id") or 0)
+    except Exception:
+        return 0
 
-    for it in blocks:
-        try:
-            tid = None
-            classes = it.get("class", []) or []
 
-            # TID из класса js-threadListItem-XXXXX
-            for c in classes:
-                if isinstance(c, str) and c.startswith("js-threadListItem-"):
-                    tid = c.replace("js-threadListItem-", "")
-                    break
+def _max_post_id(posts: List[Dict]) -> int:
+    return max((_post_id_int(p) for p in posts), default=0)
 
-            # fallback через ссылку в title блоке
-            title_a = it.select_one(".structItem-title a[data-preview-url], .structItem-title a[href]")
-            if not tid and title_a:
-                href_tmp = title_a.get("href", "")
-                m = re.search(r"\.(\d+)/?$", href_tmp)
-                if not m:
-                    m = re.search(r"/threads/[^/]+\.(\d+)/?", href_tmp)
-                if m:
-                    tid = m.group(1)
-
-            if not tid:
-                continue
 
-            tid = int(tid)
-            if tid in seen:
-                continue
-            seen.add(tid)
+def _posts_after(posts: List[Dict], last: Optional[Watermark]) -> List[Dict]:
+    """Посты новее last по возрастанию id; без last — только самый свежий."""
+    if last is None:
+        return posts[-1:]
+    fresh = {}
+    for p in posts:
+        pid = _post_id_int(p)
+        if pid > last.last_id:
+            fresh[pid] = p
+    return [fresh[k] for k in sorted(fresh)]
 
-            # Заголовок: берем превью-ссылку (реальный заголовок), иначе labelLink
-            title_el = it.select_one(".structItem-title a[data-preview-url]") or \
-                       it.select_one(".structItem-title a.labelLink") or \
-                       it.select_one(".structItem-title a[href]")
 
-            if not title_el:
-                continue
-
-            title = title_el.get_text(" ", strip=True)
-            href = title_el.get("href", "") or ""
-
-            # Убираем prefix_id
-            href = href.split("&prefix_id")[0].split("?prefix_id")[0]
+def _format_post(post: Dict) -> str:
+    text = post["text"]
+    if len(text) > 1500:
+        text = text[:1500] + "..."
+    return (
+        f"👤 {post['author']}  •  {post['date']}\n\n"
+        f"{text}\n\n"
+        f"🔗 {post['link']}"
+    )
 
-            # Абсолютный URL
-            if href.startswith("http"):
-                url = href
-            else:
-                root = base_url.split("/index.php")[0]
-                url = urljoin(root + "/", href.lstrip("/"))
-
-            # Нормализуем в формат threads/<slug>.<tid>/
-            m_full = re.search(r"/threads/([^/]+)\.(\d+)/?", url)
-            if m_full:
-                slug = m_full.group(1)
-                tid = int(m_full.group(2))
-                url = f"https://forum.matrp.ru/threads/{slug}.{tid}/"
-            else:
-                url = f"https://forum.matrp.ru/threads/topic.{tid}/"
-
-            # Автор
-            auth_el = it.select_one(".structItem-minor .username, a.username")
-            author = auth_el.get_text(strip=True) if auth_el else "Unknown"
-
-            # pinned
-            pinned = any("pinned" in c or "sticky" in c or "structItem--pinned" in c for c in classes)
-
-            # created: ищем <time> внутри structItem
-            time_el = it.select_one("time")
-            created = time_el.get("datetime", "").strip() if time_el else ""
-
-            topics.append({
-                "tid": tid,
-                "title": title,
-                "author": author,
-                "url": url,
-                "pinned": pinned,
-                "created": created
-            })
-        except Exception:
-            continue
 
-    return topics
+def _format_posts(posts: List[Dict]) -> str:
+    if len(posts) == 1:
+        return "📝 Новый пост\n" + _format_post(posts[0])
+    return f"📝 Новых постов: {len(posts)}\n\n" + "\n\n".join(_format_post(p) for p in posts)
 
 
+def forum_mark(floor: int, date: str, seen) -> Watermark:
+    """
+    last раздела: темы с tid <= floor и из seen считаются уже виденными.
+    seen держим не длиннее FORUM_SEEN_MAX, поднимая порог.
+    """
+    seen = sorted(t for t in seen if t > floor)
+    if len(seen) > FORUM_SEEN_MAX:
+        floor = seen[-FORUM_SEEN_MAX - 1]
+        seen = seen[-FORUM_SEEN_MAX:]
+    return Watermark(floor, date, frozenset(seen))
+
+
+def forum_seed_last(topics: List[Dict]) -> Optional[Watermark]:
+    """last для нового подписчика раздела: всё, что сейчас в разделе, уже видено."""
+    if not topics:
+        return None
+    newest = max(topics, key=lambda t: int(t.get("tid") or 0))
+    return forum_mark(int(newest.get("tid") or 0), newest.get("created") or "", ())
+
+
+def _topics_after(topics: List[Dict], last: Optional[Watermark]) -> Tuple[List[Dict], Optional[Watermark]]:
+    """(незакреплённые темы, которых подписчик ещё не видел, по порядку создания; новый last)."""
+    if last is None:
+        # подписчик без last — как раньше, только самая свежая тема
+        fresh = sorted((t for t in topics if not t.get("pinned")), key=lambda t: int(t.get("tid") or 0))[-1:]
+        return fresh, forum_seed_last(topics)
+
+    floor, date, seen = last.last_id, last.last_date or "", set(last.seen)
+    on_page = {int(t.get("tid") or 0): t for t in topics}
+    unseen = sorted(tid for tid in on_page if tid > floor and tid not in seen)
+    fresh = [on_page[tid] for tid in unseen if not on_page[tid].get("pinned")]
+    if fresh:
+        date = fresh[-1].get("created") or date
+    seen |= {tid for tid in on_page if tid > floor}
+    return fresh, forum_mark(floor, date, seen)
+
+
+def _format_topic(topic: Dict) -> str:
+    return (
+        f"📄 {topic.get('title')}\n"
+        f"👤 {topic.get('author')}\n"
+        f"⏱ {topic.get('created')}\n"
+        f"🔗 {topic.get('url')}"
+    )
+
+
+def _format_topics(topics: List[Dict]) -> str:
+    if len(topics) == 1:
+        return "🆕 Новая тема в разделе:\n\n" + _format_topic(topics[0])
+    return f"🆕 Новых тем в разделе: {len(topics)}\n\n" + "\n\n".join(_format_topic(t) for t in topics)
+
+
+def _watermark(subscribers) -> Optional[int]:
+    """Наименьший last среди подписчиков темы; None — у кого-то last нет (нужны все посты)."""
+    marks = []
+    for _, _, last in subscribers:
+        if last is None:
+            return None
+        marks.append(last.last_id)
+    return min(marks) if marks else None
 
 
 # ======================================================================
@@ -298,13 +315,60 @@ class ForumTracker:
     Все сетевые операции идут через self.session, чтобы держать куки.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, clock=None):
         self.interval = POLL
+        self.clock = clock or SystemClock()
+        # у каждой ссылки своё время следующей проверки
+        self.scheduler = PollScheduler(POLL_MIN_SEC, POLL_MAX_SEC, POLL_JITTER, clock=self.clock)
         self._running = False
         self._keepalive_running = True
         self.vk = None
 
-        self.session = requests.Session()
+        # url темы -> число страниц при последней проверке (кэш sources.pages)
+        self._thread_pages: Dict[str, int] = {}
+        self._pages_lock = threading.Lock()
+        # url -> time.time(), до которого RSS-лента для ссылки не используется
+        self._feed_off: Dict[str, float] = {}
+
+        self.discovery = ChangeDiscovery(
+            self.fetch_html,
+            FORUM_BASE.rstrip("/") + DISCOVERY_PATH,
+            max_pages=DISCOVERY_MAX_PAGES,
+        )
+        # id тем, изменившихся по ленте, но ещё не проверенных
+        self._pending_tids = set()
+        self._pending_lock = threading.Lock()
+        self._blind = True
+        self._next_discovery = 0.0
+        self._discoveries = 0
+
+        # last подписок, страницы тем и url_health пишутся в БД одной транзакцией в конце цикла
+        self.writes = StateBuffer(STATE_FLUSH_MAX)
+        # ссылки, которые падают раз за разом, временно не проверяем
+        self.breaker = CircuitBreaker(CIRCUIT_THRESHOLD, load=load_url_health, save=self.writes.save_url_health)
+
+        # ETag / Last-Modified / хэш тела для условных запросов трекера
+        self.http_cache = ValidatorCache()
+        # url -> отпечаток списка постов/тем при последней обработке (http_cache.region_digest);
+        # хранится в sources, чтобы после перезапуска не разбирать неизменившиеся страницы
+        try:
+            self._fingerprints: Dict[str, str] = load_fingerprints()
+        except Exception:
+            self._fingerprints = {}
+        # одновременные запросы одной страницы (цикл, /check, команды, оба трекера) идут одним запросом
+        self._inflight = inflight
+        # разобранные темы/посты на несколько секунд — общие с командами (/tlist, /checkfa ...)
+        self.page_cache = page_cache
+        # обработка страниц в async-режиме: пул живёт между циклами, чтобы потоки
+        # не открывали заново свои соединения SQLite (_known_pages) каждый цикл
+        self._workers = ThreadPoolExecutor(
+            max_workers=max(1, int(PROCESS_WORKERS)), thread_name_prefix="tracker"
+        )
+        # /check не запускает вторую проверку параллельно с идущей
+        self.checks = CheckCoordinator(self.check_all)
+
+        # все запросы к форуму идут через общий ограничитель (rate_limit.forum_limiter)
+        self.session = LimitedSession()
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
             "Accept": "*/*",
@@ -370,29 +434,55 @@ class ForumTracker:
     # -----------------------------------------------------------------
     # Утилиты доступа к сети через session
     # -----------------------------------------------------------------
-    def fetch_html(self, url: str, timeout: int = 15) -> str:
+    def fetch_html(self, url: str, timeout: int = 15, conditional: bool = False) -> Optional[str]:
         """
         Загрузить HTML используя self.session (с куками).
+
+        conditional=True — условный запрос (If-None-Match / If-Modified-Since):
+        вернёт None, если страница не изменилась с прошлого раза (304 или тот же хэш тела).
+        """
+        return self.fetch_page(url, timeout, conditional)[1]
+
+    def fetch_page(self, url: str, timeout: int = 15, conditional: bool = False) -> Tuple[int, Optional[str]]:
+        """
+        То же, что fetch_html, но вместе с HTTP-кодом: (status, html). status 0 — ответа нет.
+
+        Если та же страница уже качается в другом потоке (или в цикле через aiohttp) —
+        ждём и берём её результат. Обычному запросу не годится None от чужого условного:
+        тогда качаем сами.
         """
         if not url:
-            return ""
+            return 0, ""
 
         try:
             url = normalize_url(url)
         except Exception:
             pass
 
+        return self._inflight.do(
+            url,
+            lambda: self._fetch_html_once(url, timeout, conditional),
+            accept=None if conditional else (lambda res: res[1] is not None),
+        )
+
+    def _fetch_html_once(self, url: str, timeout: int, conditional: bool) -> Tuple[int, Optional[str]]:
         debug(f"[FETCH] GET {url}")
         try:
-            r = self.session.get(url, timeout=timeout)
-            debug(f"[FETCH] {url} -> {getattr(r, 'status_code', 'ERR')}")
-            if getattr(r, "status_code", 0) == 200:
-                return r.text
-            warn(f"HTTP {getattr(r, 'status_code', 'ERR')} for {url}")
-            return ""
+            headers = self.http_cache.request_headers(url) if conditional else None
+            r = self.session.get(url, timeout=timeout, headers=headers)
+            status = getattr(r, "status_code", 0) or 0
+            debug(f"[FETCH] {url} -> {status or 'ERR'}")
+            if conditional and status == 304:
+                return status, None
+            if status == 200:
+                if conditional and not self.http_cache.update(url, r.headers, r.text):
+                    return status, None
+                return status, r.text
+            warn(f"HTTP {status or 'ERR'} for {url}")
+            return status, ""
         except Exception as e:
             warn(f"fetch_html error: {e}")
-            return ""
+            return 0, ""
 
     def get(self, url: str, **kwargs):
         try:
@@ -415,187 +505,541 @@ class ForumTracker:
     def stop(self):
         self._running = False
         self._keepalive_running = False
+        self._flush_state()
         try:
             log_info("ForumTracker stopped")
         except Exception:
             debug("ForumTracker stopped")
 
-    def force_check(self):
-        threading.Thread(target=self.check_all, daemon=True).start()
+    def force_check(self, wait: bool = False, timeout: Optional[float] = None):
+        """
+        Запросить полную проверку. Если проверка уже идёт — запрос ждёт одну
+        следующую (сколько бы /check ни пришло, в очереди максимум одна).
+
+        wait=False — вернуть CheckTicket сразу; wait=True — дождаться и вернуть
+        {url: число новых} (None, если не уложились в timeout).
+        """
+        ticket = self.checks.request()
+        if wait:
+            return ticket.wait(timeout)
+        return ticket
 
     def _loop(self):
         while self._running:
             try:
-                self.check_all()
+                self.check_due()
             except Exception as e:
                 warn(f"loop error: {e}")
                 traceback.print_exc()
-            time.sleep(self.interval)
+            self.clock.sleep(self._idle_time())
+
+    def _idle_time(self) -> float:
+        """Спим до ближайшей запланированной проверки, но не дольше interval (новые подписки)."""
+        due = self.scheduler.next_due()
+        if due is None:
+            return self.interval
+        return min(self.interval, max(1.0, due - self.clock.now()))
+
+    def _subscriptions(self) -> Dict[str, list]:
+        """{url: [(peer_id, type, last)]} из реестра подписок в памяти (storage.registry)."""
+        return registry.by_url()
+
+    def check_due(self) -> Dict[str, int]:
+        """Проверяет только ссылки, чья очередь подошла по планировщику."""
+        with self.checks.cycle():
+            by_url = self._subscriptions()
+            self.scheduler.sync(by_url.keys())
+            self._refresh_discovery(by_url)
+            due = self.scheduler.pop_due()
+            try:
+                return self._check({u: by_url[u] for u in due if u in by_url})
+            finally:
+                self._flush_state()
+
+    def check_all(self) -> Dict[str, int]:
+        """Проверяет все ссылки сразу (/check). Обычно вызывается через force_check."""
+        with self.checks.cycle():
+            by_url = self._subscriptions()
+            self.scheduler.sync(by_url.keys())
+            self._refresh_discovery(by_url)
+            try:
+                return self._check(by_url)
+            finally:
+                self._flush_state()
 
-    def check_all(self):
-        rows = list_all_tracks()
-        if not rows:
+    def _flush_state(self):
+        """Записать накопленное за цикл состояние (last, страницы, url_health) одной транзакцией."""
+        try:
+            n = self.writes.flush()
+            if n:
+                debug(f"[state] flushed {n} changes")
+        except Exception as e:
+            warn(f"state flush error: {e}")
+
+    def _check(self, by_url: Dict[str, list]) -> Dict[str, int]:
+        """Один цикл по набору ссылок. Возвращает {url: число новых сообщений/тем}."""
+        results = {url: 0 for url in by_url}
+        todo = self._discover_changed(by_url) if by_url else {}
+        todo = {url: subs for url, subs in todo.items() if self.breaker.allow(url)}
+        if todo:
+            done = None
+            # ссылки, упавшие не по своей вине (таймаут, 5xx ...): решаем после цикла
+            soft_failed: List[str] = []
+            if FETCH_MODE == "async" and async_fetch.is_available():
+                try:
+                    done = self._check_async(todo, soft_failed)
+                except Exception as e:
+                    warn(f"async check failed, fallback to sync: {e}")
+                    soft_failed.clear()
+            if done is None:
+                done = self._check_sequential(todo, soft_failed)
+            results.update(done)
+            self._count_soft_failures(todo, soft_failed)
+        for url, n in results.items():
+            self.scheduler.record(url, n)
+        return results
+
+    def _refresh_discovery(self, by_url: Dict[str, list]):
+        """
+        Не чаще раза в POLL_MIN_SEC читаем ленту «Новые сообщения»;
+        изменившиеся темы ставим в очередь планировщика немедленно.
+        """
+        if not by_url or not DISCOVERY_ENABLED or not FORUM_BASE:
+            # подписок нет — в сеть не ходим, как и без ленты
+            return
+        now = self.clock.now()
+        if now < self._next_discovery:
             return
-        by_url = {}
-        for peer_id, url, typ, last_id in rows:
-            by_url.setdefault(url, []).append((peer_id, typ, last_id))
+        self._next_discovery = now + POLL_MIN_SEC
+        self._discoveries += 1
+        try:
+            changed = self.discovery.discover()
+        except Exception as e:
+            warn(f"discovery error: {e}")
+            changed = None
+        full = bool(DISCOVERY_FULL_EVERY) and self._discoveries % DISCOVERY_FULL_EVERY == 0
+        # что изменилось — неизвестно (или пора полной проверки): до следующего чтения ленты
+        # не фильтруем, и все темы ставим в очередь сейчас — check_due проверяет только подошедшие
+        self._blind = changed is None or full
+        if changed is not None:
+            # _since ленты уже сдвинулся — изменившиеся темы не теряем и в цикл полной проверки
+            with self._pending_lock:
+                self._pending_tids |= changed
+        for url in by_url:
+            info = analyze_url(url)
+            if info.type == "thread" and (self._blind or info.thread_id in changed):
+                self.scheduler.poke(url)
+
+    def _discover_changed(self, by_url: Dict[str, list]) -> Dict[str, list]:
+        """
+        Оставляет только темы, в которых по ленте «Новые сообщения» что-то появилось.
+        Разделы и темы без сохранённого last проверяются всегда; когда лента
+        не помогла (или раз в DISCOVERY_FULL_EVERY чтений) — проверяется всё.
+        """
+        if not DISCOVERY_ENABLED or not FORUM_BASE or self._blind:
+            return by_url
+        out = {}
         for url, subs in by_url.items():
+            info = analyze_url(url)
+            if info.type != "thread" or any(last is None for _, _, last in subs):
+                out[url] = subs
+                continue
+            tid = info.thread_id
+            with self._pending_lock:
+                if not tid or tid in self._pending_tids:
+                    self._pending_tids.discard(tid)
+                    out[url] = subs
+        debug(f"[discovery] {len(out)}/{len(by_url)} urls to check")
+        return out
+
+    def _check_jobs(self, by_url: Dict[str, list]) -> Dict[str, str]:
+        """{ссылка из БД: ссылка для загрузки}, только ссылки форума."""
+        jobs = {}
+        for url in by_url:
+            u = normalize_url(url)
+            if u.startswith(FORUM_BASE):
+                jobs[url] = self._fetch_url_for(u)
+            else:
+                debug(f"[process] skipping non-forum url: {u}")
+        return jobs
+
+    def _check_sequential(self, by_url: Dict[str, list], soft_failed: List[str]) -> Dict[str, int]:
+        done = {}
+        for url, fetch_url in self._check_jobs(by_url).items():
             try:
-                self._process_url(url, subs)
+                status, html = self.fetch_page(fetch_url, conditional=True)
             except Exception as e:
-                warn(f"_process_url error for {url}: {e}")
-                traceback.print_exc()
+                warn(f"fetch error for {fetch_url}: {e}")
+                status, html = 0, ""
+            done[url] = self._process_safe(url, by_url[url], html, status, soft_failed)
+        return done
+
+    def _check_async(self, by_url: Dict[str, list], soft_failed: List[str]) -> Dict[str, int]:
+        """Все страницы качаются параллельно через aiohttp, обработка — в пуле потоков."""
+        engine = async_fetch.AsyncFetchEngine(
+            headers=dict(self.session.headers),
+            cookies={c.name: c.value for c in self.session.cookies},
+            per_host=FETCH_PER_HOST,
+            total=FETCH_TOTAL,
+            validators=self.http_cache,
+            limiter=forum_limiter,
+            pool=self._workers,
+        )
+        done = {}
 
-    # -----------------------------------------------------------------
-    # core processor
-    # -----------------------------------------------------------------
-    def _process_url(self, url: str, subscribers):
-        url = normalize_url(url)
+        def handle(url, html, status):
+            done[url] = self._process_safe(url, by_url[url], html, status, soft_failed)
 
-        if not url.startswith(FORUM_BASE):
-            debug(f"[process] skipping non-forum url: {url}")
-            return
+        engine.run(self._check_jobs(by_url), handle)
+        return done
 
-        html = self.fetch_html(url)
-        if not html:
-            warn(f"failed to fetch: {url}")
+    def _process_safe(self, url: str, subscribers, html: Optional[str], status: int,
+                      soft_failed: List[str]) -> int:
+        self.writes.checked(normalize_url(url), time.time())
+        try:
+            new_count = self._process_url(url, subscribers, html, status) or 0
+        except FetchError as e:
+            warn(f"failed to fetch: {url} (HTTP {e.status or 'ERR'})")
+            if e.status in GONE_STATUSES:
+                self._url_failed(url, subscribers)
+            else:
+                soft_failed.append(url)
+            return 0
+        except Exception as e:
+            warn(f"_process_url error for {url}: {e}")
+            traceback.print_exc()
+            # страница не обработана — в следующем цикле качаем её целиком
+            self.http_cache.forget(self._fetch_url_for(url))
+            self._fingerprints.pop(normalize_url(url), None)
+            self.writes.set_fingerprint(normalize_url(url), None)
+            self._url_failed(url, subscribers)
+            return 0
+        if self.breaker.success(url):
+            self._notify_peers(subscribers, f"✅ Ссылка снова доступна, отслеживание продолжается:\n{url}")
+        return new_count
+
+    def _count_soft_failures(self, todo: Dict[str, list], soft_failed: List[str]):
+        """
+        Таймауты, 5xx и т.п. — ошибка ссылки, только если остальные ссылки цикла
+        загрузились. Если не загрузилось ничего — лежит форум, счётчики не трогаем;
+        только пробные проверки (half_open) возвращаем в open с новой паузой,
+        иначе ссылка так и осталась бы в half_open.
+        """
+        if not soft_failed:
+            return
+        if len(soft_failed) >= len(todo):
+            warn(f"no url loaded this cycle ({len(soft_failed)} failed) — forum unavailable?")
+            for url in soft_failed:
+                if self.breaker.probing(url):
+                    self._url_failed(url, todo[url])
             return
+        for url in soft_failed:
+            self._url_failed(url, todo[url])
+
+    def _url_failed(self, url: str, subscribers):
+        if self.breaker.failure(url):
+            self._notify_peers(
+                subscribers,
+                "⚠️ Ссылка не загружается несколько раз подряд (удалена, закрыта или переехала?):\n"
+                f"{url}\nБуду проверять её всё реже. Если она больше не нужна — /untrack {url}",
+            )
 
-        typ = detect_type(url)
+    def _send_big(self, peer_id, msg: str):
+        try:
+            if hasattr(self.vk, "send_big"):
+                self.vk.send_big(peer_id, msg)
+            else:
+                self.vk.send(peer_id, msg)
+        except Exception as e:
+            warn(f"vk send error: {e}")
 
-        # ============================================================
-        # THREAD — новые сообщения
-        # ============================================================
-        if typ == "thread":
-            posts = parse_thread_posts(html, url, self.session)
-            if not posts:
-                return
+    def _notify_peers(self, subscribers, msg: str):
+        for peer_id in {peer for peer, _, _ in subscribers}:
+            try:
+                self.vk.send(peer_id, msg)
+            except Exception as e:
+                warn(f"vk send error (health): {e}")
 
-            newest = posts[-1]
+    # -----------------------------------------------------------------
+    # Страницы темы: помним последнюю и качаем сразу её
+    # -----------------------------------------------------------------
+    def _known_pages(self, url: str) -> int:
+        with self._pages_lock:
+            pages = self._thread_pages.get(url)
+        if pages is None:
             try:
-                newest_id = int(newest["id"])
+                pages = get_thread_pages(url)
             except Exception:
-                # если не получилось конвертировать — используем строковое сравнение как fallback
-                newest_id = newest["id"]
-
-            for peer_id, _, last in subscribers:
-                try:
-                    last_id = int(last) if last is not None else 0
-                except Exception:
-                    # last может быть None или нечислом
-                    last_id = 0
-
-                send_msg = False
-                # если both numeric
-                if isinstance(newest_id, int) and isinstance(last_id, int):
-                    send_msg = newest_id > last_id
-                else:
-                    # fallback: сравнение строк
-                    send_msg = str(newest["id"]) != str(last)
-
-                if send_msg:
-                    msg = (
-                        f"📝 Новый пост\n"
-                        f"👤 {newest['author']}  •  {newest['date']}\n\n"
-                        f"{(newest['text'][:1500] + '...') if len(newest['text'])>1500 else newest['text']}\n\n"
-                        f"🔗 {newest['link']}"
-                    )
-                    try:
-                        self.vk.send(peer_id, msg)
-                    except Exception as e:
-                        warn(f"vk send error (thread): {e}")
-
-                    try:
-                        update_last(peer_id, url, str(newest_id))
-                    except Exception as e:
-                        warn(f"update_last error (thread): {e}")
+                pages = 1
+            with self._pages_lock:
+                self._thread_pages[url] = pages
+        return pages
 
+    def _remember_pages(self, url: str, pages: int):
+        if self._known_pages(url) == pages:
             return
+        with self._pages_lock:
+            self._thread_pages[url] = pages
+        try:
+            self.writes.set_thread_pages(url, pages)
+        except Exception as e:
+            warn(f"set_thread_pages error: {e}")
 
-        
-        if typ == "forum":
-            topics = parse_forum_topics(html, url)
-            if not topics:
-                return
+    def _fetch_url_for(self, url: str) -> str:
+        """Что качать для ссылки: RSS-ленту, если она работает, иначе для темы — последнюю страницу."""
+        url = normalize_url(url)
+        if self._feed_enabled(url):
+            return rss.feed_url(url)
+        if analyze_url(url).type == "thread":
+            return thread_page_url(url, self._known_pages(url))
+        return url
 
-    # Формируем sortable: (created, tid, topic)
-            sortable = []
-            for t in topics:
-                created = t.get("created") or ""
-                try:
-                    tid_i = int(t.get("tid", 0))
-                except Exception:
-                    tid_i = 0
-                sortable.append((created, tid_i, t))
+    # -----------------------------------------------------------------
+    # RSS-режим: выбирается для каждой ссылки отдельно
+    # -----------------------------------------------------------------
+    def _feed_enabled(self, url: str) -> bool:
+        if FEED_MODE == "html" or analyze_url(url).type not in ("thread", "forum"):
+            return False
+        return time.time() >= self._feed_off.get(url, 0)
 
-    # Сортируем по created (строка ISO) и затем по tid
-                sortable.sort(key=lambda x: (x[0] or "", x[1]))
+    def _disable_feed(self, url: str):
+        debug(f"[RSS] feed unavailable, using HTML for {FEED_RETRY_SEC}s: {url}")
+        self._feed_off[url] = time.time() + FEED_RETRY_SEC
 
-    # берем последнюю (самую свежую)
-                last_created, last_tid, last_topic = sortable[-1][0], sortable[-1][1], sortable[-1][2]
+    def _thread_items(self, url: str, html: str, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Посты темы; after_id — только новее него. Лента разбирается целиком и всегда идёт
+        в page_cache; HTML с after_id — нет (список неполный).
+        """
+        if rss.is_feed(html):
+            posts = rss.feed_posts(html, url)
+            if posts is not None:
+                self.page_cache.put("posts", url, posts)
+                if after_id is None:
+                    return posts
+                return [p for p in posts if _post_id_int(p) > after_id]
+        if self._feed_enabled(url):
+            # вместо ленты пришло что-то другое — переходим на HTML
+            self._disable_feed(url)
+            html = self.fetch_html(self._fetch_url_for(url))
+            if not html:
+                return []
+        posts = self._thread_tail(url, html, after_id)
+        if after_id is None:
+            self.page_cache.put("posts", url, posts)
+        return posts
 
-                for peer_id, _, last_saved in subscribers:
-                    saved_tid = 0
-                    saved_date = ""
+    def _forum_items(self, url: str, html: str) -> List[Dict]:
+        if rss.is_feed(html):
+            topics = rss.feed_topics(html, url)
+            if topics is not None:
+                # у ленты другой порядок и нет закреплённых — отдельный вид записи (см. get_topics)
+                self.page_cache.put("topics_rss", url, topics)
+                return topics
+        if self._feed_enabled(url):
+            self._disable_feed(url)
+            html = self.fetch_html(self._fetch_url_for(url))
+            if not html:
+                return []
+        topics = parse_forum_topics(html, url)
+        self.page_cache.put("topics", url, topics)
+        return topics
 
-                    if last_saved and ";;" in str(last_saved):
-                        parts = str(last_saved).split(";;", 1)
-                        try:
-                           saved_tid = int(parts[0])
-                        except Exception:
-                           saved_tid = 0
-                        saved_date = parts[1]
-                    else:
-                        try:
-                            saved_tid = int(last_saved)
-                        except Exception:
-                            saved_tid = 0
+    def _thread_tail(self, url: str, html: str, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Посты с конца темы. html — страница self._fetch_url_for(url).
+        Обычно это уже последняя страница, и дополнительных запросов нет;
+        если тема выросла, догружаются следующие страницы (THREAD_CATCHUP_PAGES).
+        after_id — разбирать только посты новее него (см. parse_thread_posts).
+        """
+        page = self._known_pages(url)
+        nav_last = parse_page_count(html)
+        posts = parse_thread_posts(html, thread_page_url(url, page), after_id=after_id)
+
+        if nav_last > page:
+            if after_id is None:
+                # нужен только конец темы (команды, page_cache) — сразу последняя страница
+                todo = [nav_last]
+            else:
+                # тема выросла: идём по страницам подряд, чтобы не потерять новые посты
+                # на промежуточных; за цикл не больше THREAD_CATCHUP_PAGES, остальные
+                # догрузятся в следующих циклах от запомненной страницы
+                todo = range(page + 1, min(nav_last, page + THREAD_CATCHUP_PAGES) + 1)
+            for n in todo:
+                page_html = self.fetch_html(thread_page_url(url, n))
+                if not page_html:
+                    break
+                more = parse_thread_posts(page_html, thread_page_url(url, n), after_id=after_id)
+                # посты текущей страницы нужны, только если следующая идёт сразу за ней
+                posts = (posts + more) if n == page + 1 else more
+                page = n
+        elif nav_last and nav_last < page:
+            # тема сократилась: форум уже отдал последнюю страницу вместо несуществующей
+            page = nav_last
+        elif not nav_last:
+            ids = scan_post_ids(html)
+            on_page = len(ids) if ids else len(posts)
+            if on_page >= POSTS_PER_PAGE:
+                # навигации нет, а страница полная — возможно, появилась следующая;
+                # новые там только посты новее последнего на этой странице
+                page_max = max(pid for pid, _ in ids) if ids else _max_post_id(posts)
+                next_html = self.fetch_html(thread_page_url(url, page + 1))
+                more = parse_thread_posts(
+                    next_html, thread_page_url(url, page + 1), after_id=max(page_max, after_id or 0)
+                ) if next_html else []
+                if more:
+                    posts = posts + more
+                    page += 1
+
+        self._remember_pages(url, page)
+        return posts
 
-                    is_new = False
+    def get_topics(self, url: str, feed_ok: bool = False) -> Optional[List[Dict]]:
+        """
+        Темы раздела для команд: из page_cache, если цикл или другая команда
+        разбирали раздел только что, иначе загрузка. None — страница не загрузилась.
 
-        # 1) если есть даты у обеих — сравниваем
-                    if last_created and saved_date:
-                        try:
-                # сравнение ISO-строк корректно работает если формат ISO (как у time@datetime)
-                            if last_created > saved_date:
-                                is_new = True
-                        except Exception:
-                            pass
+        feed_ok=True — годятся и темы из RSS-ленты, которую читал цикл (без закреплённых,
+        в порядке ленты): для списков и запоминания last, но не для /debugtopics.
+        """
+        url = normalize_url(url)
+        topics = self.page_cache.get("topics", url)
+        if topics is None and feed_ok:
+            topics = self.page_cache.get("topics_rss", url)
+        if topics is not None:
+            return topics
+        html = self.fetch_html(url)
+        if not html:
+            return None
+        topics = parse_forum_topics(html, url)
+        self.page_cache.put("topics", url, topics)
+        return topics
 
-        # 2) fallback — сравниваем tid
-                    if not is_new:
-                        if last_tid > saved_tid:
-                            is_new = True
-
-                    if not is_new:
-                        continue
-
-        # отправляем уведомление
-                    msg = (
-                        "🆕 Новая тема в разделе:\n\n"
-                        f"📄 {last_topic.get('title')}\n"
-                        f"👤 {last_topic.get('author')}\n"
-                        f"⏱ {last_created}\n"
-                        f"🔗 {last_topic.get('url')}"
-                    )
-                    try:
-                        self.vk.send(peer_id, msg)
-                    except Exception as e:
-                        warn(f"vk send error (forum): {e}")
+    def fetch_thread_posts(self, url: str) -> List[Dict]:
+        """Посты последней страницы темы (обычно один запрос)."""
+        url = normalize_url(url)
+        html = self.fetch_html(self._fetch_url_for(url))
+        if not html:
+            return []
+        try:
+            return self._thread_items(url, html)
+        finally:
+            # команды идут мимо цикла, и буфер за ними никто не сбросит (число страниц темы)
+            self._flush_state()
 
-        # сохраняем tid;;created
-                    try:
-                        update_last(peer_id, url, f"{last_tid};;{last_created}")
-                    except Exception as e:
-                        warn(f"update_last error (forum): {e}")
+    # -----------------------------------------------------------------
+    # core processor
+    # -----------------------------------------------------------------
+    def _process_url(self, url: str, subscribers, html: Optional[str], status: int = 200) -> int:
+        """
+        html — страница, скачанная условным запросом:
+          None — не изменилась с прошлого цикла (304 / тот же хэш), пропускаем;
+          ""   — скачать не удалось (status — HTTP-код ответа, 0 — ответа нет).
+        Возвращает число новых сообщений/тем (для планировщика).
+        """
+        url = normalize_url(url)
 
-                return
+        if not url.startswith(FORUM_BASE):
+            debug(f"[process] skipping non-forum url: {url}")
+            return 0
+
+        typ = analyze_url(url).type
+
+        if html is None:
+            debug(f"[process] not modified: {url}")
+            self._touch_cached(url, typ)
+            return 0
+
+        if not html and self._feed_enabled(url):
+            # лента не отдаётся (404 / отключена) — в этом же цикле берём HTML
+            self._disable_feed(url)
+            status, html = self.fetch_page(self._fetch_url_for(url), conditional=True)
+            if html is None:
+                self._touch_cached(url, typ)
+                return 0
+        if not html:
+            raise FetchError(url, status)
+
+        # список постов/тем тот же, что в прошлый раз (поменялись только токены, «онлайн» и т.п.)
+        fingerprint = self._region_fingerprint(url, typ, html, subscribers)
+        if fingerprint and self._fingerprints.get(url) == fingerprint:
+            debug(f"[process] region unchanged: {url}")
+            self._touch_cached(url, typ)
+            return 0
+
+        new_count = self._process_items(url, typ, subscribers, html)
+        if fingerprint and self._fingerprints.get(url) != fingerprint:
+            self._fingerprints[url] = fingerprint
+            self.writes.set_fingerprint(url, fingerprint)
+        return new_count
+
+    def _region_fingerprint(self, url: str, typ: str, html: str, subscribers) -> Optional[str]:
+        if rss.is_feed(html) or any(last is None for _, _, last in subscribers):
+            return None
+        # навигация по страницам вне списка постов, а от неё зависит, что качать дальше
+        extra = f"{self._known_pages(url)}:{parse_page_count(html)}" if typ == "thread" else ""
+        return region_digest(html, typ, extra)
+
+    def _touch_cached(self, url: str, typ: str):
+        """Страница не изменилась — разбор из прошлого цикла в page_cache ещё верен."""
+        for kind in (("posts",) if typ == "thread" else ("topics", "topics_rss")):
+            self.page_cache.touch(kind, url)
+
+    def _process_items(self, url: str, typ: str, subscribers, html: str) -> int:
+        """Разбор страницы и уведомления подписчикам. Возвращает число новых сообщений/тем."""
+        # last (Watermark из колонок sources) общий для всех чатов ссылки: разбор, текст уведомления
+        # и запись last — один раз на ссылку, сколько бы чатов за ней ни следило
+        last = subscribers[0][2] if subscribers else None
+        peers = sorted({peer_id for peer_id, _, _ in subscribers})
 
+        # ============================================================
+        # THREAD — новые сообщения
+        # ============================================================
+        if typ == "thread":
+            # разбираем только посты новее last
+            posts = self._thread_items(url, html, after_id=_watermark(subscribers))
+            fresh = _posts_after(posts, last)
+            if not fresh:
+                return 0
+            # все новые посты — одним сообщением (send_big сам делит длинное)
+            msg = _format_posts(fresh)
+            for peer_id in peers:
+                self._send_big(peer_id, msg)
+            newest = _post_id_int(fresh[-1])
+            if newest:
+                try:
+                    self.writes.update_last(url, Watermark(newest))
+                except Exception as e:
+                    warn(f"update_last error (thread): {e}")
+            known = last.last_id if last is not None else 0
+            return sum(1 for p in fresh if _post_id_int(p) > known)
+
+        
+        # ============================================================
+        # FORUM — новые темы
+        # ============================================================
+        if typ == "forum":
+            topics = self._forum_items(url, html)
+            if not topics:
+                return 0
+
+            fresh, new_last = _topics_after(topics, last)
+            if fresh:
+                msg = _format_topics(fresh)
+                for peer_id in peers:
+                    self._send_big(peer_id, msg)
+            if new_last is not None and new_last != last:
+                try:
+                    self.writes.update_last(url, new_last)
+                except Exception as e:
+                    warn(f"update_last error (forum): {e}")
+            return len(fresh)
 
         # ============================================================
         # UNKNOWN
         # ============================================================
         debug(f"[process] unknown type for {url}: {typ}")
+        return 0
 
     # -----------------------------------------------------------------
     # manual_fetch_posts — returns list (used by /checkfa)
@@ -606,10 +1050,17 @@ class ForumTracker:
         debug(f"[manual_fetch_posts] Cookies = {build_cookies()}")
         if not url.startswith(FORUM_BASE):
             raise ValueError("URL outside FORUM_BASE")
-        html = self.fetch_html(url)
+        posts = self.page_cache.get("posts", url)
+        if posts is not None:
+            debug(f"[manual_fetch_posts] cached posts = {len(posts)}")
+            return posts
+        html = self.fetch_html(self._fetch_url_for(url))
         if not html:
             raise RuntimeError("Failed to fetch page (check cookies)")
-        posts = parse_thread_posts(html, url, self.session)
+        try:
+            posts = self._thread_items(url, html)
+        finally:
+            self._flush_state()
         debug(f"[manual_fetch_posts] Parsed posts = {len(posts)}")
         return posts
 
@@ -622,7 +1073,7 @@ class ForumTracker:
         cookies = build_cookies()
         if not html:
             return "❌ Не удалось загрузить страницу\nCookies: " + str(cookies)
-        soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html)
         form = (
             soup.select_one("form[action*='add-reply']") or
             soup.select_one("form.js-quickReply") or
@@ -663,10 +1114,7 @@ class ForumTracker:
     def fetch_latest_post_id(self, url: str) -> Optional[str]:
         """Возвращает id самого свежего поста на thread-странице или None."""
         try:
-            html = self.fetch_html(url)
-            if not html:
-                return None
-            posts = parse_thread_posts(html, url, self.session)
+            posts = self.fetch_thread_posts(url)
             if not posts:
                 return None
             return str(posts[-1]["id"]) if posts else None
@@ -691,7 +1139,7 @@ class ForumTracker:
         if not html:
             return {"ok": False, "error": "Cannot fetch page"}
 
-        soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html)
 
         form = (
             soup.select_one("form[action*='add-reply']") or
@@ -855,7 +1303,7 @@ class ForumTracker:
         except Exception as e:
             return f"❌ Ошибка fetch_html: {e}"
 
-        soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html)
 
         selectors = [
             ".uix_stickyContainerOuter .structItem",
@@ -928,9 +1376,10 @@ def stay_online_loop():
     if not url:
         print("[ONLINE] FORUM_BASE not configured")
         return
+    session = LimitedSession()
     while True:
         try:
-            requests.get(url, cookies=cookies, timeout=10)
+            session.get(url, cookies=cookies, timeout=10)
             print("[ONLINE] ping OK")
         except Exception as e:
             print("[ONLINE ERROR]", e)
@@ -0,0 +1,108 @@
+# bot/http_cache.py
+"""
+Кэш валидаторов для условных GET-запросов (ETag / Last-Modified).
+
+Для каждой ссылки помним ETag, Last-Modified и хэш тела последнего ответа:
+  - request_headers(url) -> If-None-Match / If-Modified-Since для запроса;
+  - update(url, headers, body) -> False, если страница не изменилась
+    (тот же хэш тела — на случай, когда форум валидаторы не присылает).
+
+region_digest(html, kind) — хэш только списка постов / тем, без CSRF-токенов,
+«кто онлайн» и относительного времени, из-за которых меняется всё тело.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def body_digest(body: str) -> str:
+    return hashlib.blake2b((body or "").encode("utf-8", "replace"), digest_size=16).hexdigest()
+
+
+# начало и конец интересной части страницы (ищутся в тексте, без разбора HTML)
+_REGION_START = {
+    "thread": ('<article class="message ', "<article class='message ", 'js-post-'),
+    "forum": ('class="structItem ', "class='structItem ", 'structItem'),
+}
+_REGION_END = (
+    "block-outer--after", "block-footer", "js-quickReply",
+    "p-body-sidebar", "data-widget-key", "</body>",
+)
+
+# то, что меняется между запросами, не меняя постов/тем
+_VOLATILE_RES = (
+    re.compile(r"(<time\b[^>]*>)[^<]*(</time>)", re.I),   # «5 минут назад»
+    re.compile(r'(_xfToken=)[^"&\'\s]*'),
+    re.compile(r'(name=["\']_xfToken["\']\s+value=["\'])[^"\']*'),
+    re.compile(r'(data-csrf=["\'])[^"\']*'),
+)
+
+
+def region_digest(html: str, kind: str, extra: str = "") -> Optional[str]:
+    """
+    Хэш части страницы со списком постов (kind="thread") или тем ("forum").
+    extra добавляется к хэшу (например, число страниц темы: навигация вне списка).
+    None — список на странице не найден.
+    """
+    if not html or kind not in _REGION_START:
+        return None
+    start = -1
+    for marker in _REGION_START[kind]:
+        start = html.find(marker)
+        if start >= 0:
+            break
+    if start < 0:
+        return None
+    end = len(html)
+    for marker in _REGION_END:
+        pos = html.find(marker, start)
+        if 0 <= pos < end:
+            end = pos
+    region = html[start:end]
+    for rx in _VOLATILE_RES:
+        region = rx.sub(lambda m: "".join(g for g in m.groups() if g), region)
+    return body_digest(f"{extra}|{region}")
+
+
+class ValidatorCache:
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            entry = self._items.get(url)
+            if entry:
+                self._items.move_to_end(url)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url: str, headers, body: str) -> bool:
+        """Запоминает ответ 200. Возвращает True, если тело изменилось."""
+        digest = body_digest(body)
+        entry = {
+            "etag": (headers or {}).get("ETag") or "",
+            "last_modified": (headers or {}).get("Last-Modified") or "",
+            "digest": digest,
+        }
+        with self._lock:
+            old = self._items.pop(url, None)
+            self._items[url] = entry
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return not old or old.get("digest") != digest
+
+    def forget(self, url: str):
+        with self._lock:
+            self._items.pop(url, None)
@@ -0,0 +1,85 @@
+# bot/page_cache.py
+"""
+Короткоживущий кэш разобранных страниц (списки тем, постов, профили).
+
+Один экземпляр (page_cache) общий для трекера и CommandHandler: если цикл
+трекера только что разобрал раздел, /tlist по нему отвечает без запроса к
+форуму. Записи живут ttl секунд; при превышении max_bytes вытесняются
+самые давно использованные.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from .utils import get_setting
+
+
+def estimate_size(obj: Any) -> int:
+    """Примерный размер в байтах для списков/словарей из строк и чисел."""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class ParsedPageCache:
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, ttl: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        # (kind, url) -> (expires_at, size, value)
+        self._items: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, url: str) -> Optional[Any]:
+        key = (kind, url)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < self._clock():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return item[2]
+
+    def put(self, kind: str, url: str, value: Any):
+        if value is None or self.ttl <= 0:
+            return
+        key = (kind, url)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._items[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                self._drop(next(iter(self._items)))
+
+    def touch(self, kind: str, url: str):
+        """Продлить живую запись: страница не изменилась, разбор по-прежнему верен."""
+        key = (kind, url)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] >= self._clock():
+                self._items[key] = (self._clock() + self.ttl,) + item[1:]
+                self._items.move_to_end(key)
+
+    def _drop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
+page_cache = ParsedPageCache(
+    max_bytes=get_setting("PAGE_CACHE_BYTES", 8 * 1024 * 1024),
+    ttl=get_setting("PAGE_CACHE_TTL", 30.0),
+)
@@ -0,0 +1,93 @@
+# bot/parse_pool.py
+"""
+Разбор HTML в отдельных процессах (PARSE_WORKERS > 0).
+
+Разбор страниц — чистая нагрузка на процессор. В потоке трекера он держит GIL,
+и longpoll VK и панель отвечают с задержкой, пока идёт цикл. С PARSE_WORKERS > 0
+parse_thread_posts / parse_forum_topics отдают HTML (байты UTF-8) в пул процессов
+и получают обратно готовые списки словарей; несколько страниц разбираются
+параллельно на разных ядрах.
+
+PARSE_WORKERS = 0 (по умолчанию) — разбор в вызывающем потоке, как раньше.
+Если пул сломался или не ответил за PARSE_TIMEOUT — страница разбирается на месте.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from .parser_backend import get_backend, resolve
+from .utils import get_setting, log_error
+
+PARSE_WORKERS = get_setting("PARSE_WORKERS", 0)
+PARSE_TIMEOUT = get_setting("PARSE_TIMEOUT", 30.0)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# --- выполняются в процессах пула ---
+
+def _thread_posts(data: bytes, page_url: str, backend: str) -> List[Dict]:
+    return get_backend(backend).thread_posts(data.decode("utf-8", "replace"), page_url)
+
+
+def _forum_topics(data: bytes, base_url: str, backend: str) -> List[Dict]:
+    return get_backend(backend).forum_topics(data.decode("utf-8", "replace"), base_url)
+
+
+_JOBS = {"thread": _thread_posts, "forum": _forum_topics}
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PARSE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, а не fork: в процессе уже работают потоки (VK, трекер, панель)
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _drop_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    try:
+        pool.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def parse(kind: str, html: str, url: str) -> List[Dict]:
+    """kind: "thread" (посты) или "forum" (темы). Результат тот же, что у бэкенда напрямую."""
+    backend = resolve()
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            future = pool.submit(_JOBS[kind], (html or "").encode("utf-8"), url, backend)
+            return future.result(timeout=PARSE_TIMEOUT)
+        except (BrokenProcessPool, FutureTimeout) as e:
+            # процесс упал или завис — пул пересоздадим при следующем разборе
+            log_error(f"parse pool broken ({kind}), parsing in-process: {e!r}")
+            _drop_pool(pool)
+        except Exception as e:
+            log_error(f"parse pool error ({kind}), parsing in-process: {e!r}")
+    if kind == "thread":
+        return get_backend(backend).thread_posts(html, url)
+    return get_backend(backend).forum_topics(html, url)
+
+
+def shutdown():
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        _drop_pool(pool)
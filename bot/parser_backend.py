@@ -0,0 +1,406 @@
+# bot/parser_backend.py
+"""
+Бэкенды HTML-парсера для страниц форума.
+
+HTML_PARSER (окружение или config.py):
+  "auto"        — selectolax, если установлен, иначе lxml, иначе html.parser;
+  "selectolax"  — свой разбор на selectolax (Lexbor), самый быстрый;
+  "lxml"        — BeautifulSoup с построителем lxml;
+  "html.parser" — BeautifulSoup со встроенным парсером (как было раньше).
+
+Все бэкенды возвращают одинаковые словари постов и тем
+(проверка: python bench/parser_parity.py <папка со страницами>).
+Для редких страниц (форма ответа, профиль, отладка) есть make_soup().
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from .utils import get_setting, log_error
+
+try:
+    from selectolax.lexbor import LexborHTMLParser, LexborNode
+    # разбор ниже опирается на traverse(include_text=True) / is_text_node (selectolax >= 1.0)
+    if not (hasattr(LexborNode, "traverse") and hasattr(LexborNode, "is_text_node")):
+        LexborHTMLParser = None
+except Exception:  # selectolax не установлен
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    _HAS_LXML = True
+except Exception:
+    _HAS_LXML = False
+
+HTML_PARSER = str(get_setting("HTML_PARSER", "auto")).lower()
+
+BACKENDS = ("selectolax", "lxml", "html.parser")
+
+
+def available(name: str) -> bool:
+    if name == "selectolax":
+        return LexborHTMLParser is not None
+    if name == "lxml":
+        return _HAS_LXML
+    return name == "html.parser"
+
+
+def resolve(name: Optional[str] = None) -> str:
+    """Имя бэкенда, который реально будет работать для настройки name."""
+    name = (name or HTML_PARSER).lower()
+    if name != "auto" and available(name):
+        return name
+    if name not in ("auto",) + BACKENDS:
+        log_error(f"unknown HTML_PARSER={name!r}, using auto")
+    for candidate in BACKENDS:
+        if available(candidate):
+            return candidate
+    return "html.parser"
+
+
+def make_soup(html: str) -> BeautifulSoup:
+    """BeautifulSoup на самом быстром доступном построителе (lxml, иначе html.parser)."""
+    features = "lxml" if resolve() != "html.parser" and _HAS_LXML else "html.parser"
+    return BeautifulSoup(html or "", features)
+
+
+# ----------------------------------------------------------------------
+# общее для всех бэкендов
+# ----------------------------------------------------------------------
+
+def _clean_post_text(text: str) -> str:
+    return re.sub(r"\n{2,}", "\n", text).strip()
+
+
+def _post_dict(pid, author: str, date, text: str, page_url: str) -> Dict:
+    pid = str(pid)
+    return {
+        "id": pid,
+        "author": author,
+        "date": date,
+        "text": _clean_post_text(text),
+        "link": page_url.rstrip("/") + f"#post-{pid}",
+    }
+
+
+# Пост XenForo 2: <article class="message ..." data-content="post-N" id="js-post-N">
+# с ником (.message-name), временем (.message-attribution time) и телом
+# (article.message-body) внутри. Всё берётся из поддерева поста за один проход.
+POST_CONTAINERS = "article.message"
+POST_CONTAINERS_FALLBACK = "article[data-post-id], article[id^='js-post-']"
+POST_BODIES = "article.message-body.js-selectToQuote"
+
+# открывающий тег поста с id — для быстрого поиска без разбора HTML
+_POST_START_RE = re.compile(
+    r'<article\b[^>]*?\b(?:data-content=["\']post-|id=["\']js-post-)(\d+)["\']', re.I
+)
+
+
+def scan_post_ids(html: str) -> List[Tuple[int, int]]:
+    """[(id поста, позиция его тега <article>)] в порядке страницы — регуляркой, без построения дерева."""
+    out = []
+    seen = set()
+    for m in _POST_START_RE.finditer(html or ""):
+        pid = int(m.group(1))
+        if pid not in seen:
+            seen.add(pid)
+            out.append((pid, m.start()))
+    return out
+
+
+# (атрибут, префикс перед числом) — в порядке надёжности
+_ID_ATTRS = (
+    ("data-message-id", ""),
+    ("data-content", "post-"),
+    ("id", "js-post-"),
+    ("data-post-id", ""),
+    ("data-id", ""),
+    ("data-lb-id", "post-"),
+)
+
+
+def _post_id(attrs) -> str:
+    """Id поста из атрибутов контейнера (dict); "" — не нашли."""
+    for name, prefix in _ID_ATTRS:
+        v = (attrs.get(name) or "").strip()
+        if v.startswith(prefix) and v[len(prefix):].isdigit():
+            return v[len(prefix):]
+    return ""
+
+
+def _tid_from_classes(classes) -> Optional[str]:
+    # TID из класса js-threadListItem-XXXXX
+    for c in classes:
+        if isinstance(c, str) and c.startswith("js-threadListItem-"):
+            return c.replace("js-threadListItem-", "")
+    return None
+
+
+def _tid_from_href(href: str) -> Optional[str]:
+    m = re.search(r"\.(\d+)/?$", href)
+    if not m:
+        m = re.search(r"/threads/[^/]+\.(\d+)/?", href)
+    return m.group(1) if m else None
+
+
+def _topic_url(href: str, base_url: str, tid: int):
+    """Абсолютная ссылка темы в формате threads/<slug>.<tid>/ и tid из неё."""
+    # Убираем prefix_id
+    href = href.split("&prefix_id")[0].split("?prefix_id")[0]
+
+    if href.startswith("http"):
+        url = href
+    else:
+        root = base_url.split("/index.php")[0]
+        url = urljoin(root + "/", href.lstrip("/"))
+
+    m_full = re.search(r"/threads/([^/]+)\.(\d+)/?", url)
+    if m_full:
+        slug = m_full.group(1)
+        tid = int(m_full.group(2))
+        return f"https://forum.matrp.ru/threads/{slug}.{tid}/", tid
+    return f"https://forum.matrp.ru/threads/topic.{tid}/", tid
+
+
+def _is_pinned(classes) -> bool:
+    return any("pinned" in c or "sticky" in c or "structItem--pinned" in c for c in classes)
+
+
+# ----------------------------------------------------------------------
+# BeautifulSoup (html.parser / lxml)
+# ----------------------------------------------------------------------
+
+class SoupBackend:
+    def __init__(self, features: str = "html.parser"):
+        self.name = features
+        self.features = features
+
+    def thread_posts(self, html: str, page_url: str) -> List[Dict]:
+        soup = BeautifulSoup(html or "", self.features)
+
+        containers = soup.select(POST_CONTAINERS) or soup.select(POST_CONTAINERS_FALLBACK)
+        if not containers:
+            # нестандартная разметка: только тела постов, без обёртки
+            containers = soup.select(POST_BODIES)
+
+        out: List[Dict] = []
+        for post in containers:
+            try:
+                pid = _post_id(post.attrs)
+                if not pid:
+                    lb = post.select_one("[data-lb-id]")
+                    pid = _post_id(lb.attrs) if lb else ""
+
+                user = (
+                    post.select_one(".message-name .username")
+                    or post.select_one("h4.message-name")
+                    or post.select_one("a.username, span.username")
+                )
+                author = user.get_text(strip=True) if user else "Неизвестно"
+
+                t = post.select_one(".message-attribution time") or post.select_one("time")
+                date = t.get("datetime") if t else ""
+
+                msg = post if "message-body" in (post.get("class") or []) else \
+                    (post.select_one(POST_BODIES) or post.select_one("article.message-body") or post)
+                body = (
+                    msg.select_one("div.bbWrapper")
+                    or msg.select_one("div.message-userContent.lbContainer.js-lbContainer")
+                    or msg.select_one("div.message-userContent")
+                )
+                text = body.get_text("\n", strip=True) if body else msg.get_text("\n", strip=True)
+
+                out.append(_post_dict(pid, author, date, text, page_url))
+            except Exception as e:
+                log_error(f"parse_thread_posts error: {e}")
+                continue
+        return out
+
+    def forum_topics(self, html: str, base_url: str) -> List[Dict]:
+        soup = BeautifulSoup(html or "", self.features)
+        topics: List[Dict] = []
+        seen = set()
+
+        for it in soup.select(".structItem"):
+            try:
+                classes = it.get("class", []) or []
+                tid = _tid_from_classes(classes)
+
+                # fallback через ссылку в title блоке
+                title_a = it.select_one(".structItem-title a[data-preview-url], .structItem-title a[href]")
+                if not tid and title_a:
+                    tid = _tid_from_href(title_a.get("href", ""))
+                if not tid:
+                    continue
+
+                tid = int(tid)
+                if tid in seen:
+                    continue
+                seen.add(tid)
+
+                # Заголовок: берем превью-ссылку (реальный заголовок), иначе labelLink
+                title_el = it.select_one(".structItem-title a[data-preview-url]") or \
+                           it.select_one(".structItem-title a.labelLink") or \
+                           it.select_one(".structItem-title a[href]")
+                if not title_el:
+                    continue
+
+                title = title_el.get_text(" ", strip=True)
+                url, tid = _topic_url(title_el.get("href", "") or "", base_url, tid)
+
+                auth_el = it.select_one(".structItem-minor .username, a.username")
+                author = auth_el.get_text(strip=True) if auth_el else "Unknown"
+
+                time_el = it.select_one("time")
+                created = time_el.get("datetime", "").strip() if time_el else ""
+
+                topics.append({
+                    "tid": tid,
+                    "title": title,
+                    "author": author,
+                    "url": url,
+                    "pinned": _is_pinned(classes),
+                    "created": created,
+                })
+            except Exception:
+                continue
+        return topics
+
+
+# ----------------------------------------------------------------------
+# selectolax (Lexbor)
+# ----------------------------------------------------------------------
+
+# строки внутри этих тегов BeautifulSoup в get_text() не включает
+_NO_TEXT_TAGS = {"script", "style", "template"}
+
+
+def _lx_text(node, sep: str = "", strip: bool = True) -> str:
+    """Аналог Tag.get_text(sep, strip=True) из BeautifulSoup."""
+    parts = []
+    for n in node.traverse(include_text=True):
+        if not n.is_text_node:
+            continue
+        parent = n.parent
+        if parent is not None and parent.tag in _NO_TEXT_TAGS:
+            continue
+        s = n.text_content or ""
+        if strip:
+            s = s.strip()
+            if not s:
+                continue
+        parts.append(s)
+    return sep.join(parts)
+
+
+def _lx_classes(node) -> List[str]:
+    return (node.attributes.get("class") or "").split()
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def thread_posts(self, html: str, page_url: str) -> List[Dict]:
+        tree = LexborHTMLParser(html or "")
+
+        containers = tree.css(POST_CONTAINERS) or tree.css(POST_CONTAINERS_FALLBACK)
+        if not containers:
+            containers = tree.css(POST_BODIES)
+
+        out: List[Dict] = []
+        for post in containers:
+            try:
+                pid = _post_id(post.attributes)
+                if not pid:
+                    lb = post.css_first("[data-lb-id]")
+                    pid = _post_id(lb.attributes) if lb is not None else ""
+
+                user = (
+                    post.css_first(".message-name .username")
+                    or post.css_first("h4.message-name")
+                    or post.css_first("a.username, span.username")
+                )
+                author = _lx_text(user) if user is not None else "Неизвестно"
+
+                t = post.css_first(".message-attribution time") or post.css_first("time")
+                date = t.attributes.get("datetime") if t is not None else ""
+
+                msg = post if "message-body" in _lx_classes(post) else \
+                    (post.css_first(POST_BODIES) or post.css_first("article.message-body") or post)
+                body = (
+                    msg.css_first("div.bbWrapper")
+                    or msg.css_first("div.message-userContent.lbContainer.js-lbContainer")
+                    or msg.css_first("div.message-userContent")
+                )
+                text = _lx_text(body if body is not None else msg, "\n")
+
+                out.append(_post_dict(pid, author, date, text, page_url))
+            except Exception as e:
+                log_error(f"parse_thread_posts error: {e}")
+                continue
+        return out
+
+    def forum_topics(self, html: str, base_url: str) -> List[Dict]:
+        tree = LexborHTMLParser(html or "")
+        topics: List[Dict] = []
+        seen = set()
+
+        for it in tree.css(".structItem"):
+            try:
+                classes = _lx_classes(it)
+                tid = _tid_from_classes(classes)
+
+                title_a = it.css_first(".structItem-title a[data-preview-url], .structItem-title a[href]")
+                if not tid and title_a is not None:
+                    tid = _tid_from_href(title_a.attributes.get("href") or "")
+                if not tid:
+                    continue
+
+                tid = int(tid)
+                if tid in seen:
+                    continue
+                seen.add(tid)
+
+                title_el = it.css_first(".structItem-title a[data-preview-url]") or \
+                           it.css_first(".structItem-title a.labelLink") or \
+                           it.css_first(".structItem-title a[href]")
+                if title_el is None:
+                    continue
+
+                title = _lx_text(title_el, " ")
+                url, tid = _topic_url(title_el.attributes.get("href") or "", base_url, tid)
+
+                auth_el = it.css_first(".structItem-minor .username, a.username")
+                author = _lx_text(auth_el) if auth_el is not None else "Unknown"
+
+                time_el = it.css_first("time")
+                created = (time_el.attributes.get("datetime") or "").strip() if time_el is not None else ""
+
+                topics.append({
+                    "tid": tid,
+                    "title": title,
+                    "author": author,
+                    "url": url,
+                    "pinned": _is_pinned(classes),
+                    "created": created,
+                })
+            except Exception:
+                continue
+        return topics
+
+
+_backends: Dict[str, object] = {}
+
+
+def get_backend(name: Optional[str] = None):
+    """Бэкенд по имени (None — из настройки HTML_PARSER); недоступный заменяется доступным."""
+    name = resolve(name)
+    backend = _backends.get(name)
+    if backend is None:
+        backend = SelectolaxBackend() if name == "selectolax" else SoupBackend(name)
+        _backends[name] = backend
+    return backend
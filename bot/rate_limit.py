@@ -0,0 +1,181 @@
+# bot/rate_limit.py
+"""
+Общий ограничитель запросов к форуму.
+
+Все запросы к форуму (трекер, keepalive, stay_online_loop, команды, постинг)
+проходят через один ForumRateLimiter:
+  - token bucket: не больше rate запросов в секунду (с запасом burst);
+  - не больше max_concurrent запросов одновременно;
+  - на 429/503 — пауза по Retry-After или экспоненциальная, и скорость
+    уменьшается вдвое; после успешных ответов плавно возвращается к максимуму.
+
+LimitedSession — requests.Session, у которой каждый запрос идёт через ограничитель.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from .utils import get_setting, log_info
+
+RETRY_STATUSES = (429, 503)
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-After: число секунд или HTTP-дата."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class ForumRateLimiter:
+    def __init__(self, rate: float = 5.0, burst: int = 10, max_concurrent: int = 4,
+                 min_rate: float = 0.2, base_backoff: float = 2.0, max_backoff: float = 300.0):
+        self.max_rate = max(float(rate), 0.01)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.burst = max(1, int(burst))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._active = 0
+        self._blocked_until = 0.0
+        self._strikes = 0
+        self._cond = threading.Condition()
+
+    # -----------------------------------------------------------------
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def _try_acquire(self) -> Optional[float]:
+        """0 — слот получен; иначе сколько подождать (None — пока кто-то не освободит слот)."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._active >= self.max_concurrent:
+            return None
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        self._tokens -= 1
+        self._active += 1
+        return 0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """То же для asyncio: ждём через asyncio.sleep, не блокируя цикл событий."""
+        while True:
+            with self._cond:
+                wait = self._try_acquire()
+            if wait == 0:
+                break
+            await asyncio.sleep(min(wait if wait is not None else 0.05, 1.0))
+        try:
+            yield
+        finally:
+            self.release()
+
+    # -----------------------------------------------------------------
+    def penalize(self, retry_after=None) -> float:
+        """Форум ответил 429/503: пауза для всех запросов и снижение скорости."""
+        with self._cond:
+            self._strikes += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = self.base_backoff * (2 ** (self._strikes - 1))
+            delay = min(delay, self.max_backoff)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._cond.notify_all()
+        log_info(f"[RATE] forum overloaded, pause {delay:.1f}s, rate -> {self.rate:.2f}/s")
+        return delay
+
+    def reward(self):
+        """Успешный ответ: сбрасываем счётчик ошибок и понемногу поднимаем скорость."""
+        with self._cond:
+            self._strikes = 0
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+forum_limiter = ForumRateLimiter(
+    rate=get_setting("FORUM_RATE", 5.0),
+    burst=get_setting("FORUM_BURST", 10),
+    max_concurrent=get_setting("FORUM_CONCURRENCY", 4),
+)
+
+# сколько раз повторять запрос после 429/503
+FORUM_RETRIES = get_setting("FORUM_RETRIES", 3)
+
+
+class LimitedSession(requests.Session):
+    """requests.Session, все запросы которой идут через forum_limiter."""
+
+    def __init__(self, limiter: Optional[ForumRateLimiter] = None, retries: int = FORUM_RETRIES):
+        super().__init__()
+        self.limiter = limiter or forum_limiter
+        self.retries = retries
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            with self.limiter.slot():
+                r = super().request(method, url, *args, **kwargs)
+            if r.status_code not in RETRY_STATUSES:
+                self.limiter.reward()
+                return r
+            self.limiter.penalize(r.headers.get("Retry-After"))
+            attempt += 1
+            # повторяем только безопасные запросы — POST мог и пройти
+            if attempt > self.retries or method.upper() not in ("GET", "HEAD"):
+                return r
+
+
+_shared_session: Optional[LimitedSession] = None
+
+
+def forum_get(url: str, **kwargs) -> requests.Response:
+    """Разовый GET к форуму через общую LimitedSession (без кук трекера)."""
+    global _shared_session
+    if _shared_session is None:
+        _shared_session = LimitedSession()
+    return _shared_session.get(url, **kwargs)
@@ -0,0 +1,140 @@
+# bot/rss.py
+"""
+RSS-ленты XenForo (index.rss) для разделов и тем.
+
+Лента в разы меньше HTML-страницы и разбирается стандартным XML-парсером,
+без BeautifulSoup. Функции возвращают те же словари, что и
+parse_forum_topics / parse_thread_posts, либо None, если ответ — не RSS
+(лента отключена, форум отдал HTML-страницу ошибки и т.п.).
+"""
+from __future__ import annotations
+
+import html as html_lib
+import re
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from .utils import normalize_url
+
+NS = {
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "content": "http://purl.org/rss/1.0/modules/content/",
+}
+
+_THREAD_LINK_RE = re.compile(r"(https?://[^/]+/(?:index\.php\?)?)threads/([^/]+)\.(\d+)/?")
+_POST_ID_RE = re.compile(r"(?:post-|posts/)(\d+)")
+_TAG_RE = re.compile(r"<[^>]+>")
+_BR_RE = re.compile(r"<\s*(?:br|/p|/div|/li)\s*/?>", re.I)
+
+
+def feed_url(url: str) -> str:
+    """.../forums/slug.12/ -> .../forums/slug.12/index.rss"""
+    url = normalize_url(url).split("#")[0]
+    url = re.sub(r"page-\d+/?$", "", url)
+    if url.endswith("index.rss"):
+        return url
+    if not url.endswith("/"):
+        url += "/"
+    return url + "index.rss"
+
+
+def is_feed(text: Optional[str]) -> bool:
+    if not text:
+        return False
+    head = text.lstrip()[:300].lower()
+    return head.startswith("<?xml") or head.startswith("<rss")
+
+
+def _items(xml_text: str) -> Optional[List[ET.Element]]:
+    if not is_feed(xml_text):
+        return None
+    try:
+        root = ET.fromstring(xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text)
+    except ET.ParseError:
+        return None
+    channel = root.find("channel")
+    if root.tag != "rss" or channel is None:
+        return None
+    return channel.findall("item")
+
+
+def _text(item: ET.Element, path: str) -> str:
+    el = item.find(path, NS)
+    return (el.text or "").strip() if el is not None and el.text else ""
+
+
+def _iso_date(rfc822: str) -> str:
+    if not rfc822:
+        return ""
+    try:
+        return parsedate_to_datetime(rfc822).strftime("%Y-%m-%dT%H:%M:%S%z")
+    except Exception:
+        return ""
+
+
+def _author(item: ET.Element) -> str:
+    name = _text(item, "dc:creator")
+    if name:
+        return name
+    # <author>email (Name)</author>
+    raw = _text(item, "author")
+    m = re.search(r"\(([^)]+)\)", raw)
+    return m.group(1) if m else (raw or "Unknown")
+
+
+def _plain(fragment: str) -> str:
+    text = _BR_RE.sub("\n", fragment or "")
+    text = html_lib.unescape(_TAG_RE.sub("", text))
+    text = "\n".join(line.strip() for line in text.splitlines())
+    return re.sub(r"\n{2,}", "\n", text).strip()
+
+
+def feed_topics(xml_text: str, base_url: str) -> Optional[List[Dict]]:
+    """Темы из ленты раздела: tid, title, author, url, pinned, created."""
+    items = _items(xml_text)
+    if items is None:
+        return None
+    topics: List[Dict] = []
+    seen = set()
+    for it in items:
+        link = _text(it, "link")
+        m = _THREAD_LINK_RE.search(link)
+        if not m:
+            continue
+        tid = int(m.group(3))
+        if tid in seen:
+            continue
+        seen.add(tid)
+        topics.append({
+            "tid": tid,
+            "title": _text(it, "title"),
+            "author": _author(it),
+            "url": f"{m.group(1)}threads/{m.group(2)}.{tid}/",
+            "pinned": False,
+            "created": _iso_date(_text(it, "pubDate")),
+        })
+    return topics
+
+
+def feed_posts(xml_text: str, page_url: str) -> Optional[List[Dict]]:
+    """Посты из ленты темы (от старых к новым): id, author, date, text, link."""
+    items = _items(xml_text)
+    if items is None:
+        return None
+    posts: List[Dict] = []
+    for it in items:
+        m = _POST_ID_RE.search(_text(it, "link")) or _POST_ID_RE.search(_text(it, "guid"))
+        pid = m.group(1) if m else _text(it, "guid")
+        if not pid.isdigit():
+            continue
+        body = _text(it, "content:encoded") or _text(it, "description")
+        posts.append({
+            "id": pid,
+            "author": _author(it),
+            "date": _iso_date(_text(it, "pubDate")),
+            "text": _plain(body),
+            "link": page_url.rstrip("/") + f"#post-{pid}",
+        })
+    posts.sort(key=lambda p: int(p["id"]))
+    return posts
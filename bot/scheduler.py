@@ -0,0 +1,143 @@
+# bot/scheduler.py
+"""
+Адаптивный планировщик опроса ссылок.
+
+У каждой ссылки своё время следующей проверки (очередь с приоритетом по времени).
+Интервал подстраивается под частоту новых сообщений: чем активнее тема,
+тем чаще её проверяем, в пределах [min_interval, max_interval]; после пустых
+проверок интервал растёт не больше чем вдвое за раз. Плюс
+случайный разброс (jitter), чтобы проверки не шли пачками.
+
+Часы подставляются снаружи: SystemClock в работе, VirtualClock — для
+детерминированной проверки планировщика без реального ожидания.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class SystemClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, sec: float):
+        time.sleep(max(0.0, sec))
+
+
+class VirtualClock:
+    """Ручные часы: sleep() не ждёт, а просто сдвигает время."""
+
+    def __init__(self, start: float = 0.0):
+        self._now = float(start)
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, sec: float):
+        self.advance(sec)
+
+    def advance(self, sec: float):
+        self._now += max(0.0, sec)
+
+
+class PollScheduler:
+    """
+    sync(urls)       — привести набор ссылок к текущим подпискам (новые — сразу в очередь)
+    pop_due()        — ссылки, которым пора на проверку (они убираются из очереди)
+    record(url, n)   — результат проверки: n новых сообщений/тем; ставит следующую проверку
+    poke(url)        — проверить ссылку как можно скорее
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, jitter: float = 0.1,
+                 clock=None, rng: Optional[Callable[[], float]] = None, alpha: float = 0.3):
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.jitter = max(0.0, float(jitter))
+        self.clock = clock or SystemClock()
+        self.rng = rng or random.random
+        # вес нового наблюдения в скользящем среднем частоты сообщений
+        self.alpha = alpha
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._state: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------
+    def _push(self, url: str, due: float):
+        st = self._state[url]
+        st["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), url))
+
+    def sync(self, urls: Iterable[str]):
+        now = self.clock.now()
+        with self._lock:
+            wanted = set(urls)
+            for url in list(self._state):
+                if url not in wanted:
+                    # запись в куче станет «мёртвой» и будет пропущена в pop_due
+                    del self._state[url]
+            for url in wanted:
+                if url not in self._state:
+                    self._state[url] = {"interval": self.min_interval, "rate": 0.0, "last": now, "due": now}
+                    self._push(url, now)
+
+    def pop_due(self) -> List[str]:
+        now = self.clock.now()
+        out = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, url = heapq.heappop(self._heap)
+                st = self._state.get(url)
+                if st is None or st["due"] != due:
+                    continue
+                st["due"] = float("inf")
+                out.append(url)
+        return out
+
+    def record(self, url: str, new_items: int):
+        now = self.clock.now()
+        with self._lock:
+            st = self._state.get(url)
+            if st is None:
+                return
+            elapsed = max(now - st["last"], 1e-6)
+            st["rate"] = self.alpha * (max(0, new_items) / elapsed) + (1 - self.alpha) * st["rate"]
+            st["last"] = now
+            # цель — примерно одно новое сообщение на проверку
+            interval = 1.0 / st["rate"] if st["rate"] > 0 else self.max_interval
+            if new_items <= 0:
+                # пустая проверка: отступаем постепенно (не больше чем вдвое за раз),
+                # а не сразу к max_interval
+                interval = min(interval, st["interval"] * 2)
+            interval = min(self.max_interval, max(self.min_interval, interval))
+            st["interval"] = interval
+            spread = interval * self.jitter * (2 * self.rng() - 1)
+            self._push(url, now + max(self.min_interval * (1 - self.jitter), interval + spread))
+
+    def poke(self, url: str):
+        now = self.clock.now()
+        with self._lock:
+            st = self._state.get(url)
+            if st is not None and st["due"] > now:
+                self._push(url, now)
+
+    # -----------------------------------------------------------------
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap:
+                due, _, url = self._heap[0]
+                st = self._state.get(url)
+                if st is not None and st["due"] == due:
+                    return due
+                heapq.heappop(self._heap)
+        return None
+
+    def interval_of(self, url: str) -> Optional[float]:
+        with self._lock:
+            st = self._state.get(url)
+            return st["interval"] if st else None
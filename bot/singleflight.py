@@ -0,0 +1,97 @@
+# bot/singleflight.py
+"""
+Single-flight: одновременные вызовы с одним ключом выполняются один раз.
+
+Первый вызов («ведущий») делает работу, остальные ждут и получают
+тот же результат (или то же исключение). После завершения ключ
+освобождается — следующий вызов снова пойдёт в сеть.
+
+Ведущим может быть и поток (do), и корутина (ado) — ждущие обоих видов
+садятся на один и тот же вызов. accept(result) — подходит ли ждущему чужой
+результат; если нет, он делает свою работу сам (например, обычному запросу
+не годится None от условного запроса «страница не изменилась»).
+
+Один экземпляр (inflight) общий для всех ForumTracker и движка aiohttp.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable):
+        """(вызов, ведущий ли)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    @staticmethod
+    def _shared(call: _Call, accept: Optional[Callable[[Any], bool]]):
+        """(годится ли, результат) для ждущего."""
+        if call.error is not None:
+            raise call.error
+        if accept is not None and not accept(call.result):
+            return False, None
+        return True, call.result
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           accept: Optional[Callable[[Any], bool]] = None) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            ok, result = self._shared(call, accept)
+            return result if ok else fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                  accept: Optional[Callable[[Any], bool]] = None) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            if not call.done.is_set():
+                await asyncio.get_running_loop().run_in_executor(None, call.done.wait)
+            ok, result = self._shared(call, accept)
+            return result if ok else await fn()
+
+        try:
+            call.result = await fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+
+inflight = SingleFlight()
@@ -1,29 +1,121 @@
 # bot/storage.py
+"""
+SQLite-хранилище бота.
+
+Каждый поток держит своё долгоживущее соединение (_conn()), база в режиме WAL:
+чтение (is_banned на каждом сообщении, список подписок, панель в server.py)
+идёт параллельно с записью и не ждёт трекер. Запись из разных потоков этого
+процесса по-прежнему идёт по очереди через _lock, а между процессами —
+через busy_timeout (SQLITE_BUSY_TIMEOUT).
+"""
+import atexit
+import queue
 import sqlite3
 import threading
+import time
 import os
-from typing import List, Tuple, Optional
+from typing import Dict, FrozenSet, List, NamedTuple, Tuple, Optional
+
+from .utils import get_setting, normalize_url
 
 DB = os.getenv("BOT_DB", "bot_data.db")
+# NORMAL в WAL: коммит без fsync, база не портится при падении процесса,
+# при отключении питания можно потерять последние транзакции
+SQLITE_SYNCHRONOUS = get_setting("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_BUSY_TIMEOUT = get_setting("SQLITE_BUSY_TIMEOUT", 10.0)
+# журнал logs: очередь записи, размер пачки, период записи и хранение (дни / строки, 0 — без ограничения)
+LOG_QUEUE_MAX = get_setting("LOG_QUEUE_MAX", 10000)
+LOG_BATCH = get_setting("LOG_BATCH", 500)
+LOG_FLUSH_SEC = get_setting("LOG_FLUSH_SEC", 2.0)
+LOG_KEEP_DAYS = get_setting("LOG_KEEP_DAYS", 14)
+LOG_KEEP_ROWS = get_setting("LOG_KEEP_ROWS", 200000)
+
 _lock = threading.Lock()
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    """Соединение текущего потока; открывается один раз и закрывается вместе с потоком."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            pass  # база только для чтения / файловая система без WAL — работаем в старом режиме
+        conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+    return conn
+
+
+def _write(sql: str, params=()):
+    """Одна команда записи в своей транзакции (при ошибке — откат, соединение остаётся чистым)."""
+    with _lock:
+        conn = _conn()
+        with conn:
+            conn.execute(sql, params)
+
+
+def _write_many(sql: str, rows: list):
+    """executemany одной транзакцией."""
+    with _lock:
+        conn = _conn()
+        with conn:
+            conn.executemany(sql, rows)
+
+
+def _fetchall(sql: str, params=()) -> list:
+    return _conn().execute(sql, params).fetchall()
+
+
+def _fetchone(sql: str, params=()):
+    return _conn().execute(sql, params).fetchone()
 
-def _conn():
-    # ensure dir exists
-    return sqlite3.connect(DB, check_same_thread=False)
 
 def init_db():
     with _lock:
         conn = _conn()
         cur = conn.cursor()
-        # tracks: peer_id, url, type, last_id
+        # sources: одна строка на отслеживаемую ссылку (каноническую, normalize_url)
+        #   last_id   — тема: id последнего отправленного поста; раздел: порог tid (Watermark, forum_mark)
+        #   last_date — раздел: дата последней темы; seen — раздел: tid выше порога через запятую
+        #   pages     — сколько страниц было в теме при последней проверке
+        #   fingerprint — отпечаток списка постов/тем (http_cache.region_digest)
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS tracks (
-            peer_id INTEGER NOT NULL,
-            url TEXT NOT NULL,
+        CREATE TABLE IF NOT EXISTS sources (
+            url TEXT PRIMARY KEY,
             type TEXT NOT NULL,
-            last_id TEXT,
+            last_id INTEGER,
+            last_date TEXT,
+            seen TEXT,
+            last_check REAL,
+            pages INTEGER NOT NULL DEFAULT 1,
+            fingerprint TEXT
+        )""")
+        # subscriptions: какие чаты следят за ссылкой
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            peer_id INTEGER NOT NULL,
+            url TEXT NOT NULL REFERENCES sources(url) ON DELETE CASCADE,
             PRIMARY KEY(peer_id, url)
         )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS subscriptions_url ON subscriptions(url)")
+        # subs_version меняется при любом изменении подписок (и из панели — другого процесса):
+        # по нему реестр подписок в памяти понимает, что пора перечитать
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )""")
+        cur.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('subs_version', 0)")
+        for event in ("INSERT", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS subscriptions_{event.lower()}_version AFTER {event} ON subscriptions
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'subs_version'; END""")
         cur.execute("""
         CREATE TABLE IF NOT EXISTS warns (
             peer_id INTEGER,
@@ -37,6 +129,16 @@ def init_db():
             user_id INTEGER,
             PRIMARY KEY(peer_id, user_id)
         )""")
+        # url_health: состояние предохранителя для «сломанных» ссылок (bot/circuit.py)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS url_health (
+            url TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            failures INTEGER DEFAULT 0,
+            trips INTEGER DEFAULT 0,
+            open_until REAL DEFAULT 0,
+            notified INTEGER DEFAULT 0
+        )""")
         cur.execute("""
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,154 +147,588 @@ def init_db():
             msg TEXT
         )""")
         conn.commit()
-        conn.close()
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name='tracks'").fetchone()
+        with conn:
+            if kind and kind[0] == "table":
+                _migrate_tracks(conn)
+            # tracks — прежняя таблица подписок, теперь представление поверх sources/subscriptions
+            conn.execute("""
+            CREATE VIEW IF NOT EXISTS tracks AS
+            SELECT sub.peer_id AS peer_id, src.url AS url, src.type AS type,
+                CASE
+                    WHEN src.last_id IS NULL THEN NULL
+                    WHEN src.last_date IS NULL THEN CAST(src.last_id AS TEXT)
+                    WHEN COALESCE(src.seen, '') = '' THEN src.last_id || ';;' || src.last_date
+                    ELSE src.last_id || ';;' || src.last_date || ';;' || src.seen
+                END AS last_id
+            FROM subscriptions sub JOIN sources src ON src.url = sub.url""")
+
+
+def _split_last(last) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+    """Строка last ("123" / "<порог>;;<дата>;;<tid>,...") -> (last_id, last_date, seen) для sources."""
+    if last is None or str(last) == "":
+        return None, None, None
+    parts = str(last).split(";;")
+    last_id = int(parts[0]) if parts[0].strip().isdigit() else None
+    if last_id is None:
+        return None, None, None
+    return last_id, (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None)
+
+
+def _merge_lasts(lasts: List) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+    """
+    Общий last ссылки из last'ов её подписчиков (миграция с tracks): берём самый
+    ранний, чтобы ни один чат не пропустил сообщения. Для раздела тема выше общего
+    порога считается виденной, только если её видели все.
+    """
+    states = [st for st in map(_split_last, lasts) if st[0] is not None]
+    if not states:
+        return None, None, None
+    if all(date is None for _, date, _ in states):
+        return min(st[0] for st in states), None, None
+    views = []
+    for floor, date, seen in states:
+        views.append((floor, {int(x) for x in (seen or "").split(",") if x.isdigit()}))
+    floor = min(f for f, _ in views)
+    candidates = set().union(*(s for _, s in views))
+    seen = sorted(t for t in candidates if t > floor and all(t <= f or t in s for f, s in views))
+    date = max((d for _, d, _ in states if d is not None), default="")
+    return floor, date, ",".join(map(str, seen)) or None
+
 
-# tracks
+def _migrate_tracks(conn: sqlite3.Connection):
+    """tracks (peer_id, url, type, last_id) + thread_pages -> sources + subscriptions."""
+    rows = conn.execute("SELECT peer_id, url, type, last_id FROM tracks").fetchall()
+    pages = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='thread_pages'").fetchone():
+        pages = {normalize_url(u): p for u, p in conn.execute("SELECT url, pages FROM thread_pages")}
+    by_url: Dict[str, dict] = {}
+    for peer_id, url, type_, last_id in rows:
+        src = by_url.setdefault(normalize_url(url), {"type": type_, "peers": set(), "lasts": []})
+        src["peers"].add(peer_id)
+        src["lasts"].append(last_id)
+    for url, src in by_url.items():
+        last_id, last_date, seen = _merge_lasts(src["lasts"])
+        conn.execute(
+            "INSERT OR IGNORE INTO sources (url, type, last_id, last_date, seen, pages) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, src["type"], last_id, last_date, seen, int(pages.get(url) or 1)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO subscriptions (peer_id, url) VALUES (?, ?)",
+            [(peer_id, url) for peer_id in src["peers"]],
+        )
+    # старая таблица остаётся копией на случай отката
+    conn.execute("ALTER TABLE tracks RENAME TO tracks_legacy")
+    conn.execute("DROP TABLE IF EXISTS thread_pages")
+
+
+def _columns_text(last_id: Optional[int], last_date: Optional[str], seen: Optional[str]) -> Optional[str]:
+    """Колонки sources -> строка last (как в представлении tracks)."""
+    if last_id is None:
+        return None
+    if last_date is None:
+        return str(last_id)
+    return f"{last_id};;{last_date};;{seen}" if seen else f"{last_id};;{last_date}"
+
+
+class Watermark(NamedTuple):
+    """
+    last ссылки в колонках sources, без разбора строк:
+      тема   — last_id: id последнего отправленного поста;
+      раздел — last_id: порог tid, last_date: дата последней темы, seen: tid выше порога.
+    Строка "<порог>;;<дата>;;<tid>,..." осталась только для прежнего интерфейса
+    (list_tracks / list_all_tracks, update_last / seed_last, представление tracks).
+    """
+    last_id: int
+    last_date: Optional[str] = None
+    seen: FrozenSet[int] = frozenset()
+
+    @classmethod
+    def from_columns(cls, last_id, last_date=None, seen=None) -> Optional["Watermark"]:
+        if last_id is None:
+            return None
+        return cls(int(last_id), last_date, frozenset(int(x) for x in (seen or "").split(",") if x.isdigit()))
+
+    @classmethod
+    def parse(cls, last) -> Optional["Watermark"]:
+        """Из строки last прежнего вида ("123" / "<порог>;;<дата>;;<tid>,...")."""
+        return cls.from_columns(*_split_last(last))
+
+    def columns(self) -> Tuple[int, Optional[str], Optional[str]]:
+        """(last_id, last_date, seen) для UPDATE sources."""
+        return self.last_id, self.last_date, ",".join(map(str, sorted(self.seen))) or None
+
+    def text(self) -> str:
+        """Строка last прежнего вида — та же, что в представлении tracks."""
+        return _columns_text(*self.columns())
+
+
+def _last_text(mark: Optional[Watermark]) -> Optional[str]:
+    return mark.text() if mark is not None else None
+
+
+# реестр подписок в памяти
+class SubscriptionRegistry:
+    """
+    Подписки, сгруппированные по ссылке: {url: [(peer_id, type, last), ...]},
+    last — Watermark (или None, если last ещё нет).
+
+    Читается из БД один раз, дальше add_track / remove_track / update_last пишут
+    в SQLite и сразу правят реестр. Цикл трекера, /list и панель берут подписки
+    отсюда, без запросов к подпискам. Каждое чтение сверяет meta.subs_version (один
+    запрос по ключу): если подписки менял другой процесс (панель) — реестр
+    перечитывается целиком. last, который StateBuffer уже поменял в реестре, но
+    ещё не записал в БД, при этом не теряется (_unflushed).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version: Optional[int] = None
+        self._by_url: Dict[str, List[Tuple[int, str, Optional[Watermark]]]] = {}
+        self._by_peer: Dict[int, Dict[str, None]] = {}
+        # url -> last из StateBuffer, ещё не записанный в sources
+        self._unflushed: Dict[str, Watermark] = {}
+
+    @staticmethod
+    def _db_version() -> int:
+        r = _fetchone("SELECT value FROM meta WHERE key='subs_version'")
+        return int(r[0]) if r else 0
+
+    def _sync(self):
+        version = self._db_version()
+        if version == self._version:
+            return
+        by_url: Dict[str, List[Tuple[int, str, Optional[Watermark]]]] = {}
+        by_peer: Dict[int, Dict[str, None]] = {}
+        marks: Dict[str, Optional[Watermark]] = {}
+        rows = _fetchall(
+            "SELECT sub.peer_id, src.url, src.type, src.last_id, src.last_date, src.seen "
+            "FROM subscriptions sub JOIN sources src ON src.url = sub.url"
+        )
+        for peer_id, url, type_, last_id, last_date, seen in rows:
+            if url not in marks:
+                marks[url] = self._unflushed.get(url) or Watermark.from_columns(last_id, last_date, seen)
+            by_url.setdefault(url, []).append((peer_id, type_, marks[url]))
+            by_peer.setdefault(peer_id, {})[url] = None
+        for url in [u for u in self._unflushed if u not in by_url]:
+            del self._unflushed[url]
+        self._by_url, self._by_peer, self._version = by_url, by_peer, version
+
+    def by_url(self) -> Dict[str, List[Tuple[int, str, Optional[Watermark]]]]:
+        """Снимок {url: [(peer_id, type, last)]}; списки не меняются на месте — их можно держать весь цикл."""
+        with self._lock:
+            self._sync()
+            return dict(self._by_url)
+
+    def for_peer(self, peer_id: int) -> List[Tuple[str, str, Optional[Watermark]]]:
+        with self._lock:
+            self._sync()
+            out = []
+            for url in self._by_peer.get(peer_id, ()):
+                for p, type_, last in self._by_url.get(url, ()):
+                    if p == peer_id:
+                        out.append((url, type_, last))
+            return out
+
+    def _added(self, peer_id: int, url: str, type_: str, version: int):
+        with self._lock:
+            if version == self._version:
+                return  # реестр уже перечитан вместе с этим изменением
+            if self._version is None or version != self._version + 1:
+                self._version = None  # пропустили чужое изменение — перечитаем при следующем чтении
+                return
+            subs = self._by_url.get(url, [])
+            if all(p != peer_id for p, _, _ in subs):
+                last = subs[0][2] if subs else None
+                type_ = subs[0][1] if subs else type_
+                self._by_url[url] = subs + [(peer_id, type_, last)]
+                self._by_peer.setdefault(peer_id, {})[url] = None
+            self._version = version
+
+    def _removed(self, peer_id: int, url: str, version: int):
+        with self._lock:
+            if version == self._version:
+                return
+            if self._version is None or version != self._version + 1:
+                self._version = None
+                return
+            subs = [s for s in self._by_url.get(url, []) if s[0] != peer_id]
+            if subs:
+                self._by_url[url] = subs
+            else:
+                self._by_url.pop(url, None)
+                self._unflushed.pop(url, None)
+            self._by_peer.get(peer_id, {}).pop(url, None)
+            self._version = version
+
+    def set_last(self, url: str, mark: Optional[Watermark], only_if_empty: bool = False,
+                 unflushed: bool = False):
+        """unflushed=True — значение пока только в StateBuffer (см. flushed)."""
+        with self._lock:
+            if unflushed and mark is not None:
+                self._unflushed[url] = mark
+            subs = self._by_url.get(url)
+            if not subs or (only_if_empty and subs[0][2] is not None):
+                return
+            self._by_url[url] = [(p, type_, mark) for p, type_, _ in subs]
+
+    def flushed(self, url: str, mark: Watermark):
+        """StateBuffer записал last в БД; более новое значение, если успело прийти, остаётся."""
+        with self._lock:
+            if self._unflushed.get(url) == mark:
+                del self._unflushed[url]
+
+
+registry = SubscriptionRegistry()
+
+
+# tracks: подписки хранятся в sources + subscriptions, функции сохраняют прежний вид
 def add_track(peer_id: int, url: str, type_: str):
+    url = normalize_url(url)
     with _lock:
         conn = _conn()
-        cur = conn.cursor()
-        cur.execute("INSERT OR IGNORE INTO tracks (peer_id, url, type, last_id) VALUES (?, ?, ?, NULL)", (peer_id, url, type_))
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO sources (url, type) VALUES (?, ?)", (url, type_))
+            added = conn.execute(
+                "INSERT OR IGNORE INTO subscriptions (peer_id, url) VALUES (?, ?)", (peer_id, url)
+            ).rowcount
+            version = conn.execute("SELECT value FROM meta WHERE key='subs_version'").fetchone()[0]
+        if added:
+            registry._added(peer_id, url, type_, version)
 
 def remove_track(peer_id: int, url: str):
+    url = normalize_url(url)
     with _lock:
         conn = _conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM tracks WHERE peer_id=? AND url=?", (peer_id, url))
-        conn.commit()
-        conn.close()
+        with conn:
+            removed = conn.execute("DELETE FROM subscriptions WHERE peer_id=? AND url=?", (peer_id, url)).rowcount
+            # последний подписчик ушёл — состояние ссылки больше не нужно
+            conn.execute(
+                "DELETE FROM sources WHERE url=? AND NOT EXISTS (SELECT 1 FROM subscriptions WHERE url=?)",
+                (url, url),
+            )
+            version = conn.execute("SELECT value FROM meta WHERE key='subs_version'").fetchone()[0]
+        if removed:
+            registry._removed(peer_id, url, version)
 
+# list_tracks / list_all_tracks / update_last / seed_last — прежний интерфейс со строкой last
+# (команды, server.py); трекер берёт Watermark из registry.by_url()
 def list_tracks(peer_id: int) -> List[Tuple[str, str, Optional[str]]]:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT url, type, last_id FROM tracks WHERE peer_id=?", (peer_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return [(url, type_, _last_text(last)) for url, type_, last in registry.for_peer(peer_id)]
 
 def list_all_tracks() -> List[Tuple[int, str, str, Optional[str]]]:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT peer_id, url, type, last_id FROM tracks")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-def update_last(peer_id: int, url: str, last_id: str):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("UPDATE tracks SET last_id=? WHERE peer_id=? AND url=?", (last_id, peer_id, url))
-        conn.commit()
-        conn.close()
+    return [
+        (peer_id, url, type_, _last_text(last))
+        for url, subs in registry.by_url().items() for peer_id, type_, last in subs
+    ]
+
+def _as_mark(last) -> Optional[Watermark]:
+    return last if isinstance(last, Watermark) else Watermark.parse(last)
+
+def update_last(peer_id: int, url: str, last_id):
+    """last общий для всех чатов, следящих за ссылкой; peer_id оставлен для совместимости."""
+    url = normalize_url(url)
+    mark = _as_mark(last_id)
+    _write("UPDATE sources SET last_id=?, last_date=?, seen=? WHERE url=?",
+           (*(mark.columns() if mark else (None, None, None)), url))
+    registry.set_last(url, mark)
+
+def seed_last(url: str, last_id):
+    """
+    Начальный last новой ссылки (Watermark или строка); если last уже есть
+    (ссылку отслеживает другой чат) — не трогаем.
+    """
+    url = normalize_url(url)
+    mark = _as_mark(last_id)
+    if mark is None:
+        return
+    _write(
+        "UPDATE sources SET last_id=?, last_date=?, seen=? WHERE url=? AND last_id IS NULL",
+        (*mark.columns(), url),
+    )
+    registry.set_last(url, mark, only_if_empty=True)
+
+def load_fingerprints() -> Dict[str, str]:
+    return dict(_fetchall("SELECT url, fingerprint FROM sources WHERE fingerprint IS NOT NULL"))
+
+# thread pages
+def get_thread_pages(url: str) -> int:
+    r = _fetchone("SELECT pages FROM sources WHERE url=?", (url,))
+    return int(r[0]) if r and r[0] else 1
+
+# url health (circuit breaker)
+def load_url_health() -> Dict[str, dict]:
+    rows = _fetchall("SELECT url, state, failures, trips, open_until, notified FROM url_health")
+    return {
+        url: {"state": state, "failures": failures, "trips": trips,
+              "open_until": open_until, "notified": notified}
+        for url, state, failures, trips, open_until, notified in rows
+    }
+
+# отложенная запись состояния цикла трекера
+class StateBuffer:
+    """
+    Write-behind для состояния, которое трекер меняет каждый цикл: last, число
+    страниц, отпечаток и время проверки ссылок (sources) и состояние
+    предохранителя (url_health).
+
+    Вызовы только запоминают значение (повтор по тому же ключу заменяет прежнее),
+    flush() пишет всё накопленное одной транзакцией. Трекер зовёт flush() в конце
+    каждого цикла — до того, как цикл считается завершённым, — а буфер сам
+    сбрасывается, когда в нём набралось max_items ссылок. Если запись не удалась,
+    значения остаются в буфере до следующего flush().
+    """
+
+    def __init__(self, max_items: int = 500):
+        self.max_items = max(1, max_items)
+        self._lock = threading.Lock()
+        self._sources: Dict[str, Dict[str, object]] = {}
+        self._health: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sources) + len(self._health)
+
+    def _set(self, url: str, **cols):
+        with self._lock:
+            self._sources.setdefault(url, {}).update(cols)
+        self._maybe_flush()
+
+    def update_last(self, url: str, mark: Watermark):
+        # реестр видит новый last сразу, БД — после flush(); до записи реестр держит его
+        # поверх БД, даже если перечитает подписки
+        registry.set_last(url, mark, unflushed=True)
+        last_id, last_date, seen = mark.columns()
+        self._set(url, last_id=last_id, last_date=last_date, seen=seen)
+
+    def set_thread_pages(self, url: str, pages: int):
+        self._set(url, pages=int(pages))
+
+    def set_fingerprint(self, url: str, fingerprint: Optional[str]):
+        self._set(url, fingerprint=fingerprint)
+
+    def checked(self, url: str, ts: float):
+        self._set(url, last_check=ts)
+
+    def save_url_health(self, url: str, st: dict):
+        with self._lock:
+            self._health[url] = dict(st or {})
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self) >= self.max_items:
+            self.flush()
+
+    def flush(self) -> int:
+        """Записать накопленное одной транзакцией; возвращает число ссылок."""
+        with self._lock:
+            sources, self._sources = self._sources, {}
+            health, self._health = self._health, {}
+        if not (sources or health):
+            return 0
+        try:
+            # одинаковый набор колонок — один executemany
+            updates: Dict[Tuple[str, ...], list] = {}
+            for url, cols in sources.items():
+                names = tuple(sorted(cols))
+                updates.setdefault(names, []).append(tuple(cols[n] for n in names) + (url,))
+            healthy = [(url,) for url, st in health.items() if not st]
+            broken = [
+                (url, st["state"], st["failures"], st["trips"], st["open_until"], st["notified"])
+                for url, st in health.items() if st
+            ]
+            with _lock:
+                conn = _conn()
+                with conn:
+                    for names, rows in updates.items():
+                        sets = ", ".join(f"{n}=?" for n in names)
+                        conn.executemany(f"UPDATE sources SET {sets} WHERE url=?", rows)
+                    conn.executemany("DELETE FROM url_health WHERE url=?", healthy)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO url_health (url, state, failures, trips, open_until, notified) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        broken,
+                    )
+        except Exception:
+            # вернуть в буфер, не затирая то, что успели записать после снимка
+            with self._lock:
+                for url, cols in sources.items():
+                    cur = self._sources.setdefault(url, {})
+                    for k, v in cols.items():
+                        cur.setdefault(k, v)
+                for k, v in health.items():
+                    self._health.setdefault(k, v)
+            raise
+        for url, cols in sources.items():
+            if "last_id" in cols:
+                registry.flushed(url, Watermark.from_columns(cols["last_id"], cols["last_date"], cols["seen"]))
+        return len(sources) + len(health)
 
 # warns
 def add_warn(peer_id: int, user_id: int):
     with _lock:
         conn = _conn()
-        cur = conn.cursor()
-        cur.execute("INSERT OR IGNORE INTO warns (peer_id, user_id, count) VALUES (?, ?, 0)", (peer_id, user_id))
-        cur.execute("UPDATE warns SET count = count + 1 WHERE peer_id=? AND user_id=?", (peer_id, user_id))
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO warns (peer_id, user_id, count) VALUES (?, ?, 0)", (peer_id, user_id))
+            conn.execute("UPDATE warns SET count = count + 1 WHERE peer_id=? AND user_id=?", (peer_id, user_id))
 
 def get_warns(peer_id: int, user_id: int) -> int:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT count FROM warns WHERE peer_id=? AND user_id=?", (peer_id, user_id))
-    r = cur.fetchone()
-    conn.close()
+    r = _fetchone("SELECT count FROM warns WHERE peer_id=? AND user_id=?", (peer_id, user_id))
     return r[0] if r else 0
 
 def clear_warns(peer_id: int, user_id: int):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("UPDATE warns SET count=0 WHERE peer_id=? AND user_id=?", (peer_id, user_id))
-        conn.commit()
-        conn.close()
+    _write("UPDATE warns SET count=0 WHERE peer_id=? AND user_id=?", (peer_id, user_id))
 
 # bans
 def add_ban(peer_id: int, user_id: int):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("INSERT OR IGNORE INTO bans (peer_id, user_id) VALUES (?, ?)", (peer_id, user_id))
-        conn.commit()
-        conn.close()
+    _write("INSERT OR IGNORE INTO bans (peer_id, user_id) VALUES (?, ?)", (peer_id, user_id))
 
 def remove_ban(peer_id: int, user_id: int):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM bans WHERE peer_id=? AND user_id=?", (peer_id, user_id))
-        conn.commit()
-        conn.close()
+    _write("DELETE FROM bans WHERE peer_id=? AND user_id=?", (peer_id, user_id))
 
 def is_banned(peer_id: int, user_id: int) -> bool:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM bans WHERE peer_id=? AND user_id=?", (peer_id, user_id))
-    r = cur.fetchone()
-    conn.close()
-    return bool(r)
+    return bool(_fetchone("SELECT 1 FROM bans WHERE peer_id=? AND user_id=?", (peer_id, user_id)))
 
 # logs
+class LogSink:
+    """
+    Фоновая запись журнала в таблицу logs.
+
+    write() только кладёт запись в ограниченную очередь и никогда не ждёт: если
+    очередь полна, запись отбрасывается, а в журнал потом попадает одна строка
+    «пропущено N». Поток записи раз в flush_sec (или когда набралась пачка) пишет
+    всё накопленное одним INSERT в одной транзакции; подряд идущие одинаковые
+    строки склеиваются в одну с «(×N)». После записи, если что-то вставили,
+    удаляется понемногу (не больше пачки за раз) то, что старше keep_days или
+    сверх keep_rows.
+    """
+
+    def __init__(self, maxsize: int = 10000, batch: int = 500, flush_sec: float = 2.0,
+                 keep_days: int = 14, keep_rows: int = 200000):
+        self.batch = max(1, batch)
+        self.flush_sec = flush_sec
+        self.keep_days = keep_days
+        self.keep_rows = keep_rows
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def write(self, level: str, msg: str):
+        self._ensure_started()
+        try:
+            self._q.put_nowait((int(time.time()), level, msg))
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_sec)
+            try:
+                written = n = self._flush_once()
+                while n >= self.batch:
+                    n = self._flush_once()
+                    written += n
+                # без новых строк чистить нечего — не берём _lock ради пустых DELETE
+                if written:
+                    self._trim()
+            except Exception:
+                pass  # журнал не должен ронять бота; попробуем в следующий раз
+
+    def _take(self) -> list:
+        rows = []
+        while len(rows) < self.batch:
+            try:
+                rows.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            rows.append((int(time.time()), "WARN", f"журнал перегружен: пропущено {dropped} сообщений"))
+        return rows
+
+    @staticmethod
+    def _collapse(rows: list) -> list:
+        out = []
+        for ts, level, msg in rows:
+            if out and out[-1][1] == level and out[-1][2] == msg:
+                out[-1][3] += 1
+            else:
+                out.append([ts, level, msg, 1])
+        return [(ts, level, msg if n == 1 else f"{msg} (×{n})") for ts, level, msg, n in out]
+
+    def _flush_once(self) -> int:
+        rows = self._take()
+        if rows:
+            _write_many("INSERT INTO logs (ts, level, msg) VALUES (?, ?, ?)", self._collapse(rows))
+        return len(rows)
+
+    def _trim(self):
+        """Удаляет старое пачками по batch строк (диапазон id — без полного просмотра таблицы)."""
+        if self.keep_days > 0:
+            cutoff = int(time.time()) - self.keep_days * 86400
+            _write(
+                "DELETE FROM logs WHERE id < (SELECT MIN(id) FROM logs) + ? AND ts < ?",
+                (self.batch, cutoff),
+            )
+        if self.keep_rows > 0:
+            _write(
+                "DELETE FROM logs WHERE id <= MIN((SELECT MAX(id) FROM logs) - ?, (SELECT MIN(id) FROM logs) + ? - 1)",
+                (self.keep_rows, self.batch),
+            )
+
+    def flush(self):
+        """Записать всё из очереди сейчас (в вызывающем потоке)."""
+        while self._flush_once():
+            pass
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+log_sink = LogSink(LOG_QUEUE_MAX, LOG_BATCH, LOG_FLUSH_SEC, LOG_KEEP_DAYS, LOG_KEEP_ROWS)
+atexit.register(log_sink.close)
+
+
 def log_write(level: str, msg: str):
-    try:
-        with _lock:
-            conn = _conn()
-            cur = conn.cursor()
-            cur.execute("INSERT INTO logs (ts, level, msg) VALUES (strftime('%s','now'), ?, ?)", (level, msg))
-            conn.commit()
-            conn.close()
-    except Exception:
-        pass
+    """Не блокирует: строка уходит в очередь LogSink и пишется в logs фоновым потоком."""
+    log_sink.write(level, msg)
 
 # storage.py (append)
 def init_templates_table(conn=None):
     conn_local = conn or _conn()
-    cur = conn_local.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS templates (
-        name TEXT PRIMARY KEY,
-        text TEXT NOT NULL
-    )""")
-    conn_local.commit()
-    if conn is None:
-        conn_local.close()
+    with _lock, conn_local:
+        conn_local.execute("""
+        CREATE TABLE IF NOT EXISTS templates (
+            name TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        )""")
 
 def add_template(name: str, text: str):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("INSERT OR REPLACE INTO templates (name, text) VALUES (?, ?)", (name, text))
-        conn.commit()
-        conn.close()
+    _write("INSERT OR REPLACE INTO templates (name, text) VALUES (?, ?)", (name, text))
 
 def remove_template(name: str):
-    with _lock:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM templates WHERE name=?", (name,))
-        conn.commit()
-        conn.close()
+    _write("DELETE FROM templates WHERE name=?", (name,))
 
 def get_template(name: str) -> Optional[str]:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT text FROM templates WHERE name=?", (name,))
-    r = cur.fetchone()
-    conn.close()
+    r = _fetchone("SELECT text FROM templates WHERE name=?", (name,))
     return r[0] if r else None
 
 def list_templates() -> List[str]:
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM templates")
-    rows = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return rows
-
+    return [r[0] for r in _fetchall("SELECT name FROM templates")]
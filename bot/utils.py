@@ -1,11 +1,12 @@
 # bot/utils.py
+import os
 import re
 import sys
 from urllib.parse import urlparse, parse_qs
-from typing import Optional
+from functools import lru_cache
+from typing import NamedTuple, Optional
 import traceback
 
-import requests
 from config import FORUM_BASE
 
 HEADERS = {
@@ -22,8 +23,9 @@ def fetch_html(url: str) -> str | None:
     Используется в /tlist, /tlistall и parsing форумов.
     """
     try:
+        from .rate_limit import forum_get  # здесь, чтобы не было циклического импорта
         url = normalize_url(url)
-        r = requests.get(url, headers=HEADERS, timeout=10)
+        r = forum_get(url, headers=HEADERS, timeout=10)
 
         if r.status_code != 200:
             log_error(f"HTTP {r.status_code} for {url}")
@@ -36,39 +38,58 @@ def fetch_html(url: str) -> str | None:
         return None
 
 
+_POST_ID_RES = (
+    re.compile(r'data-message-id=["\'](\d+)["\']'),
+    re.compile(r'data-content=["\']post-(\d+)["\']'),
+    re.compile(r'id=["\']js-post-(\d+)["\']'),
+    # fallback — любые post-123 / post_123 в article
+    re.compile(r'post[-_]?(\d+)'),
+)
+
+
 def extract_post_id_from_article(article_html: str) -> str:
     """
     Извлекает ID поста из HTML статьи:
-    - <article data-content="post-123456">
     - <article data-message-id="123456">
+    - <article data-content="post-123456">
     - <article id="js-post-123456">
     """
     if not article_html:
         return ""
-
-    # Ищем pattern data-message-id="12345"
-    m = re.search(r'data-message-id=["\'](\d+)["\']', article_html)
-    if m:
-        return m.group(1)
-
-    # Ищем data-content="post-12345"
-    m = re.search(r'data-content=["\']post-(\d+)["\']', article_html)
-    if m:
-        return m.group(1)
-
-    # Ищем id="js-post-12345"
-    m = re.search(r'id=["\']js-post-(\d+)["\']', article_html)
-    if m:
-        return m.group(1)
-
-    # fallback — ищем любые числа в article, но осторожно
-    m = re.search(r'post[-_]?(\\d+)', article_html)
-    if m:
-        return m.group(1)
-
+    for rx in _POST_ID_RES:
+        m = rx.search(article_html)
+        if m:
+            return m.group(1)
     return ""
 
 
+def get_setting(name: str, default):
+    """
+    Необязательная настройка: переменная окружения -> config.py -> default.
+    Значение приводится к типу default (int / float / bool / str).
+    """
+    raw = os.getenv(name)
+    if raw is None:
+        try:
+            import config
+            raw = getattr(config, name, None)
+        except Exception:
+            raw = None
+    if raw is None:
+        return default
+    try:
+        if isinstance(default, bool):
+            if isinstance(raw, str):
+                return raw.strip().lower() in ("1", "true", "yes", "on")
+            return bool(raw)
+        if isinstance(default, int):
+            return int(raw)
+        if isinstance(default, float):
+            return float(raw)
+        return str(raw)
+    except Exception:
+        return default
+
 
 def log_info(msg: str):
     print(f"[UTILS] {msg}", file=sys.stderr)
@@ -77,9 +98,31 @@ def log_error(msg: str):
     print(f"\033[91m[UTILS ERROR] {msg}\033[0m", file=sys.stderr)
     traceback.print_exc()
 
-def normalize_url(url: str) -> str:
-    if not url:
-        return url
+class UrlInfo(NamedTuple):
+    """Разобранная ссылка форума (см. analyze_url)."""
+    url: str        # каноническая форма — то, что хранится в БД
+    type: str       # thread / forum / members / unknown
+    thread_id: int  # 0 — нет
+    forum_id: int   # 0 — нет
+    post_id: int    # 0 — нет
+    page: int       # номер страницы, 1 — первая
+    post_link: bool = False  # /posts/N: id темы в ссылке нет, thread_id здесь — id поста
+
+
+# маршрут XenForo: /threads/..., index.php?threads/..., ?threads=123, /posts/...
+_ROUTE_RE = re.compile(r"(?:^|[/?&])(threads|posts|forums|members)[/=]")
+_ROUTE_TYPES = {"threads": "thread", "posts": "thread", "forums": "forum", "members": "members"}
+_POSTS_RE = re.compile(r"[/?]posts/(\d+)")
+_DOT_ID_RE = re.compile(r"\.(\d+)(?:/|$)")
+_THREADS_SLUG_RE = re.compile(r"threads=.*?\.([0-9]+)")
+_THREADS_EQ_RE = re.compile(r"threads=([0-9]+)")
+_FORUMS_SLUG_RE = re.compile(r"forums/.*?\.(\d+)")
+_FORUMS_EQ_RE = re.compile(r"forums=([0-9]+)")
+_POST_ANCHOR_RE = re.compile(r"post-(\d+)")
+_PAGE_RE = re.compile(r"/page-(\d+)")
+
+
+def _canonical(url: str) -> str:
     url = url.strip()
     if not url.startswith(("http://", "https://")):
         url = "https://" + url
@@ -89,6 +132,46 @@ def normalize_url(url: str) -> str:
         url = url[:-1]
     return url
 
+
+def _first_int(url: str, *patterns) -> int:
+    for rx in patterns:
+        m = rx.search(url)
+        if m:
+            return int(m.group(1))
+    return 0
+
+
+@lru_cache(maxsize=4096)
+def analyze_url(url: str) -> UrlInfo:
+    """
+    Разбирает ссылку один раз: каноническая форма, тип страницы, id темы/раздела/поста
+    и номер страницы. Результат кэшируется по исходной строке — ссылки подписок
+    проверяются каждый цикл, а команды присылают одни и те же ссылки.
+    """
+    if not url:
+        return UrlInfo(url or "", "unknown", 0, 0, 0, 1)
+    canon = _canonical(url)
+    m = _ROUTE_RE.search(canon.lower())
+    # по умолчанию лучше считать темой
+    typ = _ROUTE_TYPES[m.group(1)] if m else "thread"
+    post_link = bool(m) and m.group(1) == "posts" and _POSTS_RE.search(canon) is not None
+
+    thread_id = forum_id = 0
+    if typ == "thread":
+        # для /posts/123 — id поста (тему по нему знает только форум)
+        thread_id = _first_int(canon, _POSTS_RE, _DOT_ID_RE, _THREADS_SLUG_RE, _THREADS_EQ_RE)
+    elif typ == "forum":
+        forum_id = _first_int(canon, _FORUMS_SLUG_RE, _FORUMS_EQ_RE)
+    post_id = _first_int(canon, _POSTS_RE, _POST_ANCHOR_RE) if typ == "thread" else 0
+    page = _first_int(canon, _PAGE_RE) or 1
+    return UrlInfo(canon, typ, thread_id, forum_id, post_id, page, post_link)
+
+
+def normalize_url(url: str) -> str:
+    if not url:
+        return url
+    return analyze_url(url).url
+
 def is_forum_domain(url: str, forum_base: str) -> bool:
     """
     Проверяет, начинается ли url с указанного базового домена.
@@ -104,80 +187,38 @@ def is_forum_domain(url: str, forum_base: str) -> bool:
 def detect_type(url: str) -> str:
     """
     Определяет тип страницы MatRP:
-      thread  — тема
+      thread  — тема (и ссылка на пост)
       forum   — раздел
-      members — список пользователей
-      unknown — остальное
+      members — профиль / список пользователей
+      unknown — пустая ссылка
+    Понимает и /threads/..., и index.php?threads/..., и ?threads=123.
     """
-    if not url:
-        return "unknown"
-
-    u = url.lower()
-
-    # ---- темы ----
-    if "/threads/" in u:
-        return "thread"
-    if "index.php?threads=" in u:
-        return "thread"
-    if "threads=" in u:
-        return "thread"
-    if "/posts/" in u:
-        return "thread"
-
-    # ---- форумы (разделы) ----
-    if "/forums/" in u:
-        return "forum"
-    if "index.php?forums=" in u:
-        return "forum"
-    if "forums=" in u:
-        return "forum"
-
-    # ---- участники ----
-    if "/members/" in u:
-        return "members"
-
-    # по умолчанию лучше считать темой
-    return "thread"
+    return analyze_url(url).type
 
 
 def extract_thread_id(url: str) -> str:
     """
     Пытается вытянуть числовой id темы/поста.
     """
-    if not url:
-        return ""
-    try:
-        # /posts/12345
-        m = re.search(r'/posts/(\d+)', url)
-        if m:
-            return m.group(1)
-        # .12345/ at end or .12345 in query
-        m = re.search(r'\.(\d+)(?:/|$)', url)
-        if m:
-            return m.group(1)
-        m = re.search(r'threads=.*?\.([0-9]+)', url)
-        if m:
-            return m.group(1)
-        m = re.search(r'threads=([0-9]+)', url)
-        if m:
-            return m.group(1)
-    except Exception as e:
-        log_error(f"extract_thread_id error: {e}")
-    return ""
+    tid = analyze_url(url).thread_id
+    return str(tid) if tid else ""
+
 
 def extract_forum_id(url: str) -> str:
-    if not url:
-        return ""
-    try:
-        m = re.search(r'forums/.*?\.(\d+)', url)
-        if m:
-            return m.group(1)
-        m = re.search(r'forums=([0-9]+)', url)
-        if m:
-            return m.group(1)
-    except Exception as e:
-        log_error(f"extract_forum_id error: {e}")
-    return ""
+    fid = analyze_url(url).forum_id
+    return str(fid) if fid else ""
+
+
+def thread_page_url(url: str, page: int) -> str:
+    """
+    Ссылка на страницу N темы: .../threads/slug.123/ -> .../threads/slug.123/page-N/
+    """
+    url = re.sub(r'page-\d+/?$', '', normalize_url(url).split("#")[0])
+    if page <= 1:
+        return url
+    if not url.endswith("/"):
+        url += "/"
+    return f"{url}page-{page}/"
 
 def truncate_text(s: str, limit: int = 1500) -> str:
     if not s:
@@ -4,7 +4,7 @@ import threading
 import time
 import sys
 import traceback
-from typing import Callable
+from typing import Callable, Optional
 
 import vk_api
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
@@ -102,11 +102,14 @@ class VKBot:
     def set_trigger(self, fn: Callable):
         self._trigger_check_callback = fn
 
-    def trigger_check(self) -> bool:
+    def trigger_check(self, wait: bool = False, timeout: Optional[float] = None):
+        """
+        Запросить проверку у трекера. Возвращает то, что вернул трекер
+        (CheckTicket, или результат при wait=True), либо False при ошибке.
+        """
         if self._trigger_check_callback:
             try:
-                self._trigger_check_callback()
-                return True
+                return self._trigger_check_callback(wait=wait, timeout=timeout)
             except Exception as e:
                 print("trigger_check error:", e)
                 return False
@@ -108,25 +108,6 @@ def ensure_config():
     return config
 
 
-# =====================================================
-# LOAD CONFIG
-# =====================================================
-
-config = ensure_config()
-
-from config import (
-    VK_TOKEN,
-    XF_USER,
-    XF_TFA_TRUST,
-    XF_SESSION,
-    XF_CSRF,
-    FORUM_BASE,
-    POLL_INTERVAL_SEC
-)
-
-from bot.vk_bot import VKBot
-from bot.forum_tracker import ForumTracker, stay_online_loop
-
 # =====================================================
 # INFO
 # =====================================================
@@ -178,6 +159,17 @@ def banner():
 # =====================================================
 
 def run():
+    # Конфиг и модули бота грузим только здесь: parse_pool стартует воркеры
+    # через spawn, и каждый воркер заново импортирует этот файл как
+    # __mp_main__ — на уровне модуля не должно быть ни вопросов в консоль,
+    # ни импорта всего бота.
+    ensure_config()
+
+    from config import XF_USER, XF_TFA_TRUST, XF_SESSION
+
+    from bot.vk_bot import VKBot
+    from bot.forum_tracker import ForumTracker, stay_online_loop
+
     clear_console()
     loader()
     clear_console()